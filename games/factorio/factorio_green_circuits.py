@@ -1,28 +1,7 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from fractions import Fraction
-
-
-class F(Fraction):
-    def __format__(self, *args, **kwargs):
-        return format(float(self), *args, **kwargs)
-    def __add__(self, other):
-        return F(super().__add__(other))
-    def __radd__(self, other):
-        return F(super().__radd__(other))
-    def __sub__(self, other):
-        return F(super().__sub__(other))
-    def __rsub__(self, other):
-        return F(super().__rsub__(other))
-    def __mul__(self, other):
-        return F(super().__mul__(other))
-    def __rmul__(self, other):
-        return F(super().__rmul__(other))
-    def __truediv__(self, other):
-        return F(super().__truediv__(other))
-    def __rtruediv__(self, other):
-        return F(super().__rtruediv__(other))
+from rational import F
 
 
 def green_circuits(target):
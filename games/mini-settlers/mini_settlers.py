@@ -3,7 +3,11 @@
 
 from collections import defaultdict
 from dataclasses import dataclass
-from fractions import Fraction
+import json
+import multiprocessing
+import sys
+
+from rational import F
 
 
 """The fractional production time formula has been determined
@@ -47,27 +51,6 @@ water well running for ~75 minutes on triple speed.
 """
 
 
-class F(Fraction):
-    def __format__(self, *args, **kwargs):
-        return format(float(self), *args, **kwargs)
-    def __add__(self, other):
-        return F(super().__add__(other))
-    def __radd__(self, other):
-        return F(super().__radd__(other))
-    def __sub__(self, other):
-        return F(super().__sub__(other))
-    def __rsub__(self, other):
-        return F(super().__rsub__(other))
-    def __mul__(self, other):
-        return F(super().__mul__(other))
-    def __rmul__(self, other):
-        return F(super().__rmul__(other))
-    def __truediv__(self, other):
-        return F(super().__truediv__(other))
-    def __rtruediv__(self, other):
-        return F(super().__rtruediv__(other))
-
-
 @dataclass
 class Building:
     name: str
@@ -362,47 +345,292 @@ BUILDINGS = [
 ]
 
 
-def add_to_tally(target, source):
+def add_to_tally(target, source, factor=1):
     for key, value in source.items():
-        target[key] += value
+        target[key] += factor * value
 
 
-def get_index(buildings):
+def get_index(buildings, verbose=True):
     building_index = {}
     producer_index = {}
     for building in buildings:
         _, resource_produced = building.target
         if resource_produced in producer_index:
             existing = producer_index[resource_produced]
-            print(f"skipping {building.name} in favour of {existing.name}")
+            if verbose:
+                print(f"skipping {building.name} in favour of {existing.name}")
         else:
             producer_index[resource_produced] = building
         building_index[building.name] = building
     return building_index, producer_index
 
 
-def get_requirements(amount, resource, producer_index, given):
+def get_net_production(building):
+    """Return the net production per minute of one building as a dict
+    from resources to amounts, with consumed ingredients negative."""
+    cycles_per_minute = building.get_cycles_per_minute()
+    net = defaultdict(int)
+    amount, resource = building.target
+    net[resource] += amount * cycles_per_minute
+    for amount, ingredient in building.sources:
+        net[ingredient] -= amount * cycles_per_minute
+    return net
+
+
+def invert_matrix(matrix):
+    """Invert a sparse square matrix of fractions by Gauss-Jordan
+    elimination.
+
+    The matrix is given as a dict mapping row keys to dicts mapping
+    column keys to the nonzero entries, with the same set of keys for
+    rows and columns. The inverse is returned in the same format.
+    """
+    rows = {key: (dict(row), {key: F(1)}) for key, row in matrix.items()}
+    remaining = set(rows)
+    pivot_rows = {}
+    for column in matrix:
+        if column in remaining and rows[column][0].get(column):
+            pivot_row = column
+        else:
+            pivot_row = next((key for key in matrix if key in remaining
+                              and rows[key][0].get(column)), None)
+            if pivot_row is None:
+                raise ValueError(f"singular matrix (column {column})")
+        remaining.remove(pivot_row)
+        pivot_rows[column] = pivot_row
+
+        left, right = rows[pivot_row]
+        factor = 1 / left[column]
+        for part in (left, right):
+            for key in part:
+                part[key] *= factor
+
+        for key, (other_left, other_right) in rows.items():
+            multiple = other_left.get(column)
+            if key == pivot_row or not multiple:
+                continue
+            for other, part in ((other_left, left), (other_right, right)):
+                for entry_key, value in part.items():
+                    new_value = other.get(entry_key, 0) - multiple * value
+                    if new_value:
+                        other[entry_key] = new_value
+                    else:
+                        other.pop(entry_key, None)
+    return {column: rows[pivot_rows[column]][1] for column in matrix}
+
+
+def get_balance_inverse(producer_index, given):
+    """Solve the steady-state balance of all producible resources.
+
+    There is one unknown per resource that is produced but not given:
+    the number of its producers. The balance equation of resource r
+    states that the net production of r by all producers equals the
+    demand for r. A recipe cycle like the water pump's (bread needs
+    wheat, which needs water) only adds off-diagonal entries to this
+    system, so it needs no special treatment.
+
+    The result maps each resource r to a dict that maps each resource
+    s to the number of producers of r needed per unit of demand for s,
+    i.e., it is the inverse of the balance matrix.
+    """
+    resources = [resource for resource in producer_index
+                 if resource not in given]
+    matrix = {resource: {} for resource in resources}
+    for producer_resource in resources:
+        net = get_net_production(producer_index[producer_resource])
+        for resource, amount in net.items():
+            if resource in matrix and amount:
+                matrix[resource][producer_resource] = amount
+    return invert_matrix(matrix)
+
+
+def get_usable_producers(buildings, given):
+    """Return a dict mapping each resource that can be made at all to
+    the list of buildings that can produce it.
+
+    A building is usable if each of its sources is given or produced
+    by a usable building, without circular reasoning: a water pump
+    whose bread ultimately needs pumped water is only usable if there
+    is some other source of water. The first list entry for each
+    resource is the building that made it available, so choosing the
+    first entries gives a producer choice without recipe cycles.
+    """
+    producers = defaultdict(list)
+    unused = list(buildings)
+    changed = True
+    while changed:
+        changed = False
+        for building in list(unused):
+            if all(ingredient in given or ingredient in producers
+                   for _, ingredient in building.sources):
+                producers[building.get_resource_produced()].append(building)
+                unused.remove(building)
+                changed = True
+    # Keep the remaining alternatives in the order of the building list.
+    for resource, resource_producers in producers.items():
+        first, *others = resource_producers
+        others.sort(key=buildings.index)
+        resource_producers[1:] = others
+    return producers
+
+
+def get_unit_costs(producer_index, given, weights):
+    """Return the weighted number of buildings needed per unit of each
+    resource for the given choice of producers."""
+    inverse = get_balance_inverse(producer_index, given)
+    costs = defaultdict(int)
+    for resource, row in inverse.items():
+        weight = weights.get(producer_index[resource].name, 1)
+        for demanded, num_producers in row.items():
+            costs[demanded] += weight * num_producers
+    return costs
+
+
+def get_optimal_index(buildings, given=frozenset(), weights=None, verbose=True):
+    """Choose one producer per resource so that the weighted number of
+    buildings is minimal.
+
+    weights maps building names to positive weights, defaulting to 1,
+    which minimizes the total building count.
+
+    Each building makes a single resource, so the choice that minimizes
+    the cost per unit of every resource simultaneously is optimal for
+    every build at once. We find it by policy iteration, which amounts
+    to the simplex method on the linear program over all producers:
+    start from a choice without recipe cycles, compute the exact unit
+    costs under the current choice by solving the balance system, and
+    switch every resource to a producer that is strictly cheaper under
+    these costs, until no such producer exists. The costs strictly
+    decrease in every round, so no choice is seen twice.
+    """
+    if weights is None:
+        weights = {}
+    if any(weight <= 0 for weight in weights.values()):
+        raise ValueError("building weights must be positive")
+    given = frozenset(given)
+    usable = get_usable_producers(buildings, given)
+    producer_index = {resource: producers[0]
+                      for resource, producers in usable.items()}
+    while True:
+        costs = get_unit_costs(producer_index, given, weights)
+        changed = False
+        for resource, producers in usable.items():
+            if resource in given:
+                continue
+
+            def get_cost(building):
+                cycles_per_minute = building.get_cycles_per_minute()
+                cost = weights.get(building.name, 1)
+                for amount, ingredient in building.sources:
+                    if ingredient not in given:
+                        cost += amount * cycles_per_minute * costs[ingredient]
+                return cost / building.get_production_per_minute()[0]
+
+            best = producer_index[resource]
+            best_cost = get_cost(best)
+            for building in producers:
+                cost = get_cost(building)
+                if cost < best_cost:
+                    best, best_cost = building, cost
+            if best is not producer_index[resource]:
+                producer_index[resource] = best
+                changed = True
+        if not changed:
+            break
+
+    building_index = {building.name: building for building in buildings}
+    for resource, producers in usable.items():
+        if verbose and len(producers) > 1 and resource not in given:
+            chosen = producer_index[resource]
+            others = [building.name for building in producers
+                      if building is not chosen]
+            print(f"using {chosen.name} for {resource} "
+                  f"instead of {', '.join(others)}")
+    return building_index, producer_index
+
+
+# Requirements per unit of each resource, for each producer choice
+# analyzed so far. The producer choices are keyed by their recipes.
+requirements_caches = {}
+
+
+def get_requirements_cache(producer_index):
+    key = tuple((resource, repr(building))
+                for resource, building in producer_index.items())
+    return requirements_caches.setdefault(key, {})
+
+
+def get_unit_requirements(resource, producer_index, given, cache):
+    """Return the ingredient and building tallies for producing one unit
+    of resource.
+
+    The balance of the building set is solved once per set of given
+    resources, and the tallies are kept in cache. Everything else
+    scales linearly. The tallies list resources in depth-first order
+    of the recipe graph from resource.
+    """
+    key = ("unit", resource, given)
+    if key in cache:
+        return cache[key]
+
+    inverse_key = ("inverse", given)
+    if inverse_key not in cache:
+        cache[inverse_key] = get_balance_inverse(producer_index, given)
+    inverse = cache[inverse_key]
+
+    num_producers = {}
+    if resource not in given:
+        if resource not in producer_index:
+            raise ValueError(f"no producer for {resource}")
+        for produced, row in inverse.items():
+            if row.get(resource):
+                num_producers[produced] = row[resource]
+    if any(value < 0 for value in num_producers.values()):
+        raise ValueError(f"{resource} cannot be produced: "
+                         "a recipe cycle consumes more than it produces")
+
+    consumed = defaultdict(int)
+    if resource in given:
+        consumed[resource] += F(1)
+    for produced, count in num_producers.items():
+        producer = producer_index[produced]
+        cycles_per_minute = producer.get_cycles_per_minute()
+        for amount, ingredient in producer.sources:
+            if ingredient in given or ingredient not in producer_index:
+                consumed[ingredient] += count * amount * cycles_per_minute
+
+    ingredients = {}
+    buildings = {}
+    visited = set()
+    stack = [resource]
+    while stack:
+        current = stack.pop()
+        if current in visited:
+            continue
+        visited.add(current)
+        if current in given:
+            ingredients[f"{current} [given]"] = consumed[current]
+            continue
+        if current not in producer_index:
+            raise ValueError(f"no producer for {current}")
+        producer = producer_index[current]
+        count = num_producers[current]
+        ingredients[current] = count * producer.get_production_per_minute()[0]
+        buildings[producer.name] = count
+        stack.extend(ingredient for _, ingredient in reversed(producer.sources))
+    cache[key] = ingredients, buildings
+    return ingredients, buildings
+
+
+def get_requirements(amount, resource, producer_index, given, cache=None):
+    if cache is None:
+        cache = {}
+    unit_ingredients, unit_buildings = get_unit_requirements(
+        resource, producer_index, frozenset(given), cache)
     ingredients = defaultdict(int)
     buildings = defaultdict(int)
-    if resource in given:
-        ingredients[f"{resource} [given]"] += amount
-    else:
-        ingredients[resource] += amount
-
-        producer = producer_index[resource]
-        amount_produced, item_produced = producer.target
-        assert item_produced == resource
-
-        num_production_cycles = F(amount, amount_produced)
-        work_needed = producer.duration * num_production_cycles
-        num_buildings = work_needed / 60
-
-        buildings[producer.name] += num_buildings
-        for needed_per_cycle, ingredient in producer.sources:
-            needed = num_production_cycles * needed_per_cycle
-            rec_ingredients, rec_buildings = get_requirements(needed, ingredient, producer_index, given)
-            add_to_tally(ingredients, rec_ingredients)
-            add_to_tally(buildings, rec_buildings)
+    add_to_tally(ingredients, unit_ingredients, amount)
+    add_to_tally(buildings, unit_buildings, amount)
     return ingredients, buildings
 
 
@@ -430,26 +658,128 @@ def get_needs(build, building_index, producer_index):
     return needs_list
 
 
-def analyze_build(build, buildings, given=set()):
-    print(f"analyzing build for {build}...")
-    if given:
-        print(f"assuming as given resources: {', '.join(sorted(given))}")
-
-    building_index, producer_index = get_index(buildings)
+def get_build_totals(build, building_index, producer_index, given):
     needs_list = get_needs(build, building_index, producer_index)
+    cache = get_requirements_cache(producer_index)
 
     total_ingredients = defaultdict(int)
     total_buildings = defaultdict(int)
     for amount, need in needs_list:
-        ingredient_tally, building_tally = get_requirements(amount, need, producer_index, given)
+        ingredient_tally, building_tally = get_requirements(amount, need, producer_index, given, cache)
         add_to_tally(total_ingredients, ingredient_tally)
         add_to_tally(total_buildings, building_tally)
+    return total_ingredients, total_buildings
+
+
+def analyze_build(build, buildings, given=set(), optimize=False, weights=None):
+    print(f"analyzing build for {build}...")
+    if given:
+        print(f"assuming as given resources: {', '.join(sorted(given))}")
+
+    if optimize:
+        building_index, producer_index = get_optimal_index(buildings, given, weights)
+    else:
+        building_index, producer_index = get_index(buildings)
+    total_ingredients, total_buildings = get_build_totals(
+        build, building_index, producer_index, given)
     print("ingredients production per minute:")
     print_tally(total_ingredients, "  ")
     print("buildings needed:")
     print_tally(total_buildings, "  ")
 
 
+def get_map_name(get_buildings):
+    return get_buildings.__name__.removeprefix("get_buildings_").replace("_", " ")
+
+
+def get_tally_report(tally):
+    return [{"name": element, "amount": float(amount), "exact": str(amount)}
+            for element, amount in sorted(tally.items(), key=lambda pair: -pair[1])]
+
+
+def analyze_map_jobs(task):
+    """Analyze the jobs for one map preset.
+
+    The building list and its index are built once and shared by all
+    jobs, and so are the requirements computed for them. Return the
+    reports of the jobs together with their positions in the batch.
+    """
+    get_buildings, numbered_jobs, optimize = task
+    buildings = get_buildings()
+    indexes = {}
+    results = []
+    for position, (build, given) in numbered_jobs:
+        given = frozenset(given)
+        report = {
+            "map": get_map_name(get_buildings),
+            "build": build,
+            "given": sorted(given),
+        }
+        try:
+            index_key = given if optimize else None
+            if index_key not in indexes:
+                if optimize:
+                    indexes[index_key] = get_optimal_index(buildings, given, verbose=False)
+                else:
+                    indexes[index_key] = get_index(buildings, verbose=False)
+            building_index, producer_index = indexes[index_key]
+            total_ingredients, total_buildings = get_build_totals(
+                build, building_index, producer_index, given)
+        except ValueError as error:
+            report["error"] = str(error)
+        else:
+            report["total buildings"] = float(sum(total_buildings.values()))
+            report["ingredients"] = get_tally_report(total_ingredients)
+            report["buildings"] = get_tally_report(total_buildings)
+        results.append((position, report))
+    return results
+
+
+def analyze_batch(jobs, processes=None, optimize=False):
+    """Analyze a list of jobs (map preset function, build, given
+    resources) and return a list of reports in the same order.
+
+    The jobs for each map preset run together in one of up to processes
+    worker processes (by default, one per CPU), so that they can share
+    the work for that map. The reports do not depend on the number of
+    processes or the order in which the jobs finish.
+    """
+    jobs_by_map = defaultdict(list)
+    for position, (get_buildings, build, given) in enumerate(jobs):
+        jobs_by_map[get_buildings].append((position, (build, given)))
+    tasks = [(get_buildings, numbered_jobs, optimize)
+             for get_buildings, numbered_jobs in jobs_by_map.items()]
+    if processes == 1 or len(tasks) == 1:
+        results = [analyze_map_jobs(task) for task in tasks]
+    else:
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            results = pool.map(analyze_map_jobs, tasks)
+    reports = [None] * len(jobs)
+    for map_results in results:
+        for position, report in map_results:
+            reports[position] = report
+    return reports
+
+
+def print_batch_report(reports, report_format="table"):
+    if report_format == "json":
+        json.dump(reports, sys.stdout, indent=1)
+        print()
+        return
+    if report_format != "table":
+        raise ValueError(report_format)
+    print(f"{'map':18} {'given':16} {'buildings':>9}  build")
+    for report in reports:
+        given = ", ".join(report["given"]) or "-"
+        if "error" in report:
+            result = "error"
+        else:
+            result = f"{report['total buildings']:9.3f}"
+        print(f"{report['map']:18} {given:16} {result:>9}  {report['build']}")
+        if "error" in report:
+            print(f"  {report['error']}")
+
+
 def get_building(name):
     for building in BUILDINGS:
         if building.name == name:
@@ -492,6 +822,79 @@ def print_total_upm(building_name, *args, tag=None):
     print(f"total: {total:.2f}")
 
 
+def get_allocation_table(building, max_tiles, max_buildings):
+    """Compute the best tile allocations for a harvesting building by
+    dynamic programming over tile counts.
+
+    Entry [k][t] of the result is a pair (upm, num_tiles) that describes
+    the best allocation with at most k buildings on at most t tiles:
+    upm is its total production per minute, and num_tiles is the tile
+    count of one of its buildings (0 if it uses fewer than k
+    buildings). The rest of the allocation is found in entry
+    [k - 1][t - num_tiles]. A single table answers all queries up to
+    the given bounds.
+    """
+    upm_per_tiles = [building.get_fractional_production_per_minute(num_tiles)
+                     for num_tiles in range(1, building.max_tiles + 1)]
+    table = [[(F(0), 0)] * (max_tiles + 1)]
+    for num_buildings in range(1, max_buildings + 1):
+        previous = table[-1]
+        row = []
+        for total_tiles in range(max_tiles + 1):
+            best = (previous[total_tiles][0], 0)
+            for num_tiles in range(min(total_tiles, building.max_tiles), 0, -1):
+                upm = upm_per_tiles[num_tiles - 1] + previous[total_tiles - num_tiles][0]
+                if upm > best[0]:
+                    best = (upm, num_tiles)
+            row.append(best)
+        table.append(row)
+    return table
+
+
+def get_allocation(table, num_tiles, max_buildings):
+    """Return the total UPM and the tile counts (in decreasing order) of
+    the best allocation in a table from get_allocation_table."""
+    total = table[max_buildings][num_tiles][0]
+    allocation = []
+    while max_buildings:
+        tiles = table[max_buildings][num_tiles][1]
+        if tiles:
+            allocation.append(tiles)
+            num_tiles -= tiles
+        max_buildings -= 1
+    return total, sorted(allocation, reverse=True)
+
+
+def optimize_allocation(building_name, num_tiles, max_buildings):
+    building = get_building(building_name)
+    table = get_allocation_table(building, num_tiles, max_buildings)
+    return get_allocation(table, num_tiles, max_buildings)
+
+
+def print_optimal_allocations(lakes):
+    """Print the best allocation for each of a list of lakes, given as
+    tuples (building name, tile budget, maximum number of buildings,
+    tag). Lakes with the same building share one table."""
+    bounds = defaultdict(lambda: (0, 0))
+    for building_name, num_tiles, max_buildings, _ in lakes:
+        max_tiles, most_buildings = bounds[building_name]
+        bounds[building_name] = (max(max_tiles, num_tiles),
+                                 max(most_buildings, max_buildings))
+    tables = {
+        building_name: get_allocation_table(get_building(building_name), *bound)
+        for building_name, bound in bounds.items()}
+    for building_name, num_tiles, max_buildings, tag in lakes:
+        total, allocation = get_allocation(
+            tables[building_name], num_tiles, max_buildings)
+        print(f"best allocation of {num_tiles} tiles to at most "
+              f"{max_buildings} buildings:")
+        if allocation:
+            print_total_upm(building_name, *allocation, tag=tag)
+        else:
+            print("none")
+        print()
+
+
 def main():
     if False:
         analyze_build("1 native village center I", get_buildings_eden_isle())
@@ -520,11 +923,40 @@ def main():
         print_total_upm("water well", 9, 9, 9, 5, 3, 3, 2, tag="South Lake")
         print()
 
+    if False:
+        print_optimal_allocations([
+            ("water well", 16, 5, "North Lake"),
+            ("water well", 21, 5, "Center Lake"),
+            ("water well", 40, 7, "South Lake"),
+        ])
+
     if True:
         analyze_build("1 city center I, 1 city center II, 1 city center III",
                       get_buildings_peaks_island(),
                       given={})
 
+    if False:
+        analyze_build("1 city center I, 1 city center II, 1 city center III",
+                      BUILDINGS, optimize=True)
+
+    if False:
+        jobs = [
+            (get_buildings_eden_isle, "1 native village center I", set()),
+            (get_buildings_crystal_cove, "2 city center II", set()),
+            (get_buildings_harbor_islands, "2 city center II, 1 native village center II", set()),
+            (get_buildings_coral_crescent, "3 city center II", set()),
+            (get_buildings_coral_haven, "2 city center III", set()),
+            (get_buildings_pearl_island,
+             "2 city center II, 1 native village center I, 1 native village center II", set()),
+            (get_buildings_dolphin_islands, "3 city center III", set()),
+            (get_buildings_bean_islands, "3 city center III, 1 native village center III", set()),
+            (get_buildings_emerald_islands, "2 city center III, 1 native village center III", set()),
+            (get_buildings_peaks_island, "1 city center I, 1 city center II, 1 city center III", set()),
+            (get_buildings_peaks_island, "1 city center I, 1 city center II, 1 city center III",
+             {"water", "coal"}),
+        ]
+        print_batch_report(analyze_batch(jobs), "table")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,374 @@
+"""Exact rational numbers for the game calculators.
+
+F behaves like fractions.Fraction, except that it formats like a float,
+so that f"{x:8.3f}" works, and that it is considerably faster for the
+operations the calculators use.
+
+Fraction normalizes every result with a gcd computation and goes
+through generic argument handling on every operation, and subclassing
+it to change the formatting means wrapping every result in a second,
+again normalized object. F stores numerator and denominator in plain
+slots, builds results directly, and uses the usual tricks to keep the
+gcd computations small: adding an integer or multiplying by one needs
+at most one gcd, and adding two fractions needs one gcd of the
+denominators plus one of the result, which is often 1.
+
+Arithmetic with floats produces floats, as with Fraction, and F
+implements the full numbers.Rational interface.
+"""
+
+import math
+import numbers
+import operator
+from fractions import Fraction
+
+
+__all__ = ["F"]
+
+
+def _make(numerator, denominator):
+    # Build an F from a numerator and a positive denominator that are
+    # already coprime.
+    result = object.__new__(F)
+    result.numerator = numerator
+    result.denominator = denominator
+    return result
+
+
+def _normalize(numerator, denominator):
+    if denominator == 0:
+        raise ZeroDivisionError(f"F({numerator}, 0)")
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    g = math.gcd(numerator, denominator)
+    if g != 1:
+        numerator //= g
+        denominator //= g
+    return _make(numerator, denominator)
+
+
+def _add(na, da, nb, db):
+    if da == 1 and db == 1:
+        return _make(na + nb, 1)
+    g = math.gcd(da, db)
+    if g == 1:
+        return _make(na * db + da * nb, da * db)
+    s = da // g
+    t = na * (db // g) + nb * s
+    g2 = math.gcd(t, g)
+    if g2 == 1:
+        return _make(t, s * db)
+    return _make(t // g2, s * (db // g2))
+
+
+def _mul(na, da, nb, db):
+    g1 = math.gcd(na, db)
+    if g1 != 1:
+        na //= g1
+        db //= g1
+    g2 = math.gcd(nb, da)
+    if g2 != 1:
+        nb //= g2
+        da //= g2
+    return _make(na * nb, da * db)
+
+
+def _div(na, da, nb, db):
+    if nb == 0:
+        raise ZeroDivisionError("division by zero")
+    if nb < 0:
+        nb, db = -nb, -db
+    return _mul(na, da, db, nb)
+
+
+def _parts(value):
+    """Return numerator and denominator of an integer or rational
+    value, or None for anything else."""
+    if type(value) is F:
+        return value.numerator, value.denominator
+    if type(value) is int:
+        return value, 1
+    if isinstance(value, numbers.Rational):
+        return value.numerator, value.denominator
+    return None
+
+
+class F:
+    __slots__ = ("numerator", "denominator")
+
+    def __new__(cls, numerator=0, denominator=None):
+        if denominator is None:
+            if type(numerator) is int:
+                return _make(numerator, 1)
+            if type(numerator) is F:
+                return numerator
+            # Let Fraction deal with floats, decimals and strings.
+            value = Fraction(numerator)
+            return _make(value.numerator, value.denominator)
+        if type(numerator) is int and type(denominator) is int:
+            return _normalize(numerator, denominator)
+        value = Fraction(numerator, denominator)
+        return _make(value.numerator, value.denominator)
+
+    def __repr__(self):
+        return f"F({self.numerator}, {self.denominator})"
+
+    def __str__(self):
+        if self.denominator == 1:
+            return str(self.numerator)
+        return f"{self.numerator}/{self.denominator}"
+
+    def __format__(self, *args, **kwargs):
+        return format(float(self), *args, **kwargs)
+
+    def __reduce__(self):
+        return (F, (self.numerator, self.denominator))
+
+    def __add__(a, b):
+        if type(b) is int:
+            return _make(a.numerator + b * a.denominator, a.denominator)
+        parts = _parts(b)
+        if parts is not None:
+            return _add(a.numerator, a.denominator, *parts)
+        if isinstance(b, float):
+            return float(a) + b
+        return NotImplemented
+
+    def __radd__(b, a):
+        if type(a) is int:
+            return _make(a * b.denominator + b.numerator, b.denominator)
+        parts = _parts(a)
+        if parts is not None:
+            return _add(*parts, b.numerator, b.denominator)
+        if isinstance(a, float):
+            return a + float(b)
+        return NotImplemented
+
+    def __sub__(a, b):
+        if type(b) is int:
+            return _make(a.numerator - b * a.denominator, a.denominator)
+        parts = _parts(b)
+        if parts is not None:
+            nb, db = parts
+            return _add(a.numerator, a.denominator, -nb, db)
+        if isinstance(b, float):
+            return float(a) - b
+        return NotImplemented
+
+    def __rsub__(b, a):
+        if type(a) is int:
+            return _make(a * b.denominator - b.numerator, b.denominator)
+        parts = _parts(a)
+        if parts is not None:
+            return _add(*parts, -b.numerator, b.denominator)
+        if isinstance(a, float):
+            return a - float(b)
+        return NotImplemented
+
+    def __mul__(a, b):
+        parts = _parts(b)
+        if parts is not None:
+            return _mul(a.numerator, a.denominator, *parts)
+        if isinstance(b, float):
+            return float(a) * b
+        return NotImplemented
+
+    def __rmul__(b, a):
+        parts = _parts(a)
+        if parts is not None:
+            return _mul(*parts, b.numerator, b.denominator)
+        if isinstance(a, float):
+            return a * float(b)
+        return NotImplemented
+
+    def __truediv__(a, b):
+        parts = _parts(b)
+        if parts is not None:
+            return _div(a.numerator, a.denominator, *parts)
+        if isinstance(b, float):
+            return float(a) / b
+        return NotImplemented
+
+    def __rtruediv__(b, a):
+        parts = _parts(a)
+        if parts is not None:
+            return _div(*parts, b.numerator, b.denominator)
+        if isinstance(a, float):
+            return a / float(b)
+        return NotImplemented
+
+    def __floordiv__(a, b):
+        parts = _parts(b)
+        if parts is not None:
+            nb, db = parts
+            return (a.numerator * db) // (a.denominator * nb)
+        if isinstance(b, float):
+            return float(a) // b
+        return NotImplemented
+
+    def __rfloordiv__(b, a):
+        parts = _parts(a)
+        if parts is not None:
+            na, da = parts
+            return (na * b.denominator) // (da * b.numerator)
+        if isinstance(a, float):
+            return a // float(b)
+        return NotImplemented
+
+    def __mod__(a, b):
+        parts = _parts(b)
+        if parts is not None:
+            return a - (a // b) * b
+        if isinstance(b, float):
+            return float(a) % b
+        return NotImplemented
+
+    def __rmod__(b, a):
+        parts = _parts(a)
+        if parts is not None:
+            return F(*parts) % b
+        if isinstance(a, float):
+            return a % float(b)
+        return NotImplemented
+
+    def __divmod__(a, b):
+        parts = _parts(b)
+        if parts is not None:
+            quotient = a // b
+            return quotient, a - quotient * b
+        if isinstance(b, float):
+            return divmod(float(a), b)
+        return NotImplemented
+
+    def __rdivmod__(b, a):
+        parts = _parts(a)
+        if parts is not None:
+            return divmod(F(*parts), b)
+        if isinstance(a, float):
+            return divmod(a, float(b))
+        return NotImplemented
+
+    def __pow__(a, b):
+        if type(b) is F and b.denominator == 1:
+            b = b.numerator
+        if type(b) is int:
+            if b >= 0:
+                return _make(a.numerator ** b, a.denominator ** b)
+            return _div(1, 1, a.numerator ** -b, a.denominator ** -b)
+        if isinstance(b, numbers.Rational):
+            return float(a) ** float(b)
+        if isinstance(b, (float, complex)):
+            return float(a) ** b
+        return NotImplemented
+
+    def __rpow__(b, a):
+        if b.denominator == 1 and isinstance(a, numbers.Rational):
+            return F(a) ** b.numerator
+        if isinstance(a, numbers.Rational):
+            return float(a) ** float(b)
+        if isinstance(a, (float, complex)):
+            return a ** float(b)
+        return NotImplemented
+
+    def __neg__(a):
+        return _make(-a.numerator, a.denominator)
+
+    def __pos__(a):
+        return a
+
+    def __abs__(a):
+        return _make(abs(a.numerator), a.denominator)
+
+    def __bool__(a):
+        return a.numerator != 0
+
+    def __float__(a):
+        return a.numerator / a.denominator
+
+    def __complex__(a):
+        return complex(float(a))
+
+    @property
+    def real(a):
+        return a
+
+    @property
+    def imag(a):
+        return 0
+
+    def conjugate(a):
+        return a
+
+    def as_integer_ratio(a):
+        return a.numerator, a.denominator
+
+    def limit_denominator(a, max_denominator=1000000):
+        value = Fraction(a.numerator, a.denominator)
+        value = value.limit_denominator(max_denominator)
+        return _make(value.numerator, value.denominator)
+
+    def __int__(a):
+        if a.numerator < 0:
+            return -(-a.numerator // a.denominator)
+        return a.numerator // a.denominator
+
+    __trunc__ = __int__
+
+    def __floor__(a):
+        return a.numerator // a.denominator
+
+    def __ceil__(a):
+        return -(-a.numerator // a.denominator)
+
+    def __round__(a, ndigits=None):
+        result = round(Fraction(a.numerator, a.denominator), ndigits)
+        if ndigits is None:
+            return result
+        return _make(result.numerator, result.denominator)
+
+    def __hash__(a):
+        if a.denominator == 1:
+            return hash(a.numerator)
+        return hash(Fraction(a.numerator, a.denominator))
+
+    def _compare(a, b, op):
+        parts = _parts(b)
+        if parts is not None:
+            nb, db = parts
+            return op(a.numerator * db, nb * a.denominator)
+        if isinstance(b, float):
+            if math.isnan(b) or math.isinf(b):
+                return op(0.0, b)
+            return op(a, F(b))
+        return NotImplemented
+
+    def __eq__(a, b):
+        if type(b) is F:
+            return (a.numerator == b.numerator and
+                    a.denominator == b.denominator)
+        if type(b) is int:
+            return a.denominator == 1 and a.numerator == b
+        return a._compare(b, operator.eq)
+
+    def __lt__(a, b):
+        if type(b) is F:
+            return a.numerator * b.denominator < b.numerator * a.denominator
+        return a._compare(b, operator.lt)
+
+    def __le__(a, b):
+        if type(b) is F:
+            return a.numerator * b.denominator <= b.numerator * a.denominator
+        return a._compare(b, operator.le)
+
+    def __gt__(a, b):
+        if type(b) is F:
+            return a.numerator * b.denominator > b.numerator * a.denominator
+        return a._compare(b, operator.gt)
+
+    def __ge__(a, b):
+        if type(b) is F:
+            return a.numerator * b.denominator >= b.numerator * a.denominator
+        return a._compare(b, operator.ge)
+
+
+numbers.Rational.register(F)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""Benchmarks for rational.py.
+
+Compares rational.F against the Fraction subclass that the game
+calculators used before, both on single operations and on complete
+runs of the calculators. For the calculator runs, the output with both
+implementations is compared to make sure it is identical.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import timeit
+from fractions import Fraction
+
+import rational
+
+
+GAMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, "games")
+sys.path.insert(0, os.path.join(GAMES_DIR, "factorio"))
+sys.path.insert(0, os.path.join(GAMES_DIR, "mini-settlers"))
+
+import factorio_coal_liquefaction
+import factorio_green_circuits
+import mini_settlers
+
+
+class LegacyF(Fraction):
+    def __format__(self, *args, **kwargs):
+        return format(float(self), *args, **kwargs)
+    def __add__(self, other):
+        return LegacyF(super().__add__(other))
+    def __radd__(self, other):
+        return LegacyF(super().__radd__(other))
+    def __sub__(self, other):
+        return LegacyF(super().__sub__(other))
+    def __rsub__(self, other):
+        return LegacyF(super().__rsub__(other))
+    def __mul__(self, other):
+        return LegacyF(super().__mul__(other))
+    def __rmul__(self, other):
+        return LegacyF(super().__rmul__(other))
+    def __truediv__(self, other):
+        return LegacyF(super().__truediv__(other))
+    def __rtruediv__(self, other):
+        return LegacyF(super().__rtruediv__(other))
+
+
+IMPLEMENTATIONS = [("legacy", LegacyF), ("rational", rational.F)]
+
+OPERATIONS = [
+    ("x + y", "x + y"),
+    ("x + 1", "x + 1"),
+    ("x - y", "x - y"),
+    ("x * y", "x * y"),
+    ("3 * x", "3 * x"),
+    ("x / y", "x / y"),
+    ("x < y", "x < y"),
+    ("F(a, b)", "F(a, b)"),
+    ("sum", "sum(values)"),
+    ("format", "format(x, '8.3f')"),
+]
+
+
+def run_mini_settlers():
+    mini_settlers.requirements_caches.clear()
+    for build, get_buildings in [
+            ("1 native village center I", mini_settlers.get_buildings_eden_isle),
+            ("3 city center II", mini_settlers.get_buildings_coral_crescent),
+            ("3 city center III", mini_settlers.get_buildings_dolphin_islands),
+            ("1 city center I, 1 city center II, 1 city center III",
+             mini_settlers.get_buildings_peaks_island)]:
+        mini_settlers.analyze_build(build, get_buildings())
+        mini_settlers.analyze_build(build, get_buildings(), given={"water"})
+    mini_settlers.analyze_build(
+        "2 city center III, 1 native village center III",
+        mini_settlers.BUILDINGS, optimize=True)
+    mini_settlers.print_all_production_stats()
+    mini_settlers.print_optimal_allocations([
+        ("water well", 40, 7, "South Lake"), ("wheat farm", 200, 4, None)])
+
+
+def run_factorio():
+    for coal in [1, 180, 365]:
+        factorio_coal_liquefaction.coal_to_plastic(coal)
+    for target in [15, 30, 45]:
+        factorio_green_circuits.green_circuits(target)
+
+
+CALCULATORS = [
+    ("mini settlers", [mini_settlers], run_mini_settlers),
+    ("factorio", [factorio_coal_liquefaction, factorio_green_circuits],
+     run_factorio),
+]
+
+
+def time_calculator(modules, func, implementation, repetitions):
+    """Run func with F replaced by implementation in the given modules.
+    Return the best time and the output."""
+    saved = [module.F for module in modules]
+    for module in modules:
+        module.F = implementation
+    try:
+        times = []
+        for _ in range(repetitions):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+    finally:
+        for module, original in zip(modules, saved):
+            module.F = original
+    return min(times), output.getvalue()
+
+
+def benchmark_operations(number):
+    print(f"{'operation':12} " +
+          " ".join(f"{name:>12}" for name, _ in IMPLEMENTATIONS) + "   speedup")
+    for name, statement in OPERATIONS:
+        times = []
+        for _, implementation in IMPLEMENTATIONS:
+            namespace = {
+                "F": implementation, "a": 355, "b": 113,
+                "x": implementation(355, 113), "y": implementation(22, 7),
+                "values": [implementation(i, 7) for i in range(10)],
+            }
+            times.append(min(timeit.repeat(statement, globals=namespace,
+                                           number=number, repeat=3)))
+        print(f"{name:12} " +
+              " ".join(f"{seconds / number * 1e6:10.3f}us" for seconds in times) +
+              f"   x{times[0] / times[-1]:.2f}")
+
+
+def benchmark_calculators(repetitions):
+    print(f"{'calculator':14} " +
+          " ".join(f"{name:>12}" for name, _ in IMPLEMENTATIONS) + "   speedup")
+    for name, modules, func in CALCULATORS:
+        results = [time_calculator(modules, func, implementation, repetitions)
+                   for _, implementation in IMPLEMENTATIONS]
+        outputs = set(output for _, output in results)
+        if len(outputs) != 1:
+            sys.exit(f"error: output of {name} differs between implementations")
+        times = [seconds for seconds, _ in results]
+        print(f"{name:14} " +
+              " ".join(f"{seconds * 1000:10.1f}ms" for seconds in times) +
+              f"   x{times[0] / times[-1]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000,
+                        help="number of executions per operation timing")
+    parser.add_argument("--repetitions", type=int, default=5,
+                        help="report the best of this many calculator runs")
+    args = parser.parse_args()
+    benchmark_operations(args.number)
+    print()
+    benchmark_calculators(args.repetitions)
+
+
+if __name__ == "__main__":
+    main()
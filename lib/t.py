@@ -2,9 +2,14 @@
 
 """t is for people that want do things, not organize their tasks."""
 
-import os, re, sys, hashlib
+import os, sys, itertools, marshal, struct
+from array import array
+from bisect import bisect_left
 from operator import itemgetter
-from optparse import OptionParser, OptionGroup
+
+# The modules re, hashlib, optparse, socket and concurrent.futures are only
+# imported where they are used, so that a t call answered by a running
+# server (see _TaskServer) does not pay for importing them.
 
 
 class InvalidTaskfile(Exception):
@@ -24,12 +29,30 @@ class UnknownPrefix(Exception):
         self.prefix = prefix
 
 
+# Number of journal entries after which write() compacts the journal into
+# the task files instead of appending to it.
+JOURNAL_COMPACT_THRESHOLD = 200
+
+# Suffixes of the files of a list other than the task file itself.
+LIST_FILE_SUFFIXES = ('.done', '.journal', '.cache', '.index', '.tmp')
+
+# Bump this when the layout of the parsed-task cache files changes.
+CACHE_VERSION = 1
+
+# Bump this when the layout of the grep index files changes.
+INDEX_VERSION = 2
+
+# Number of index segments after which they are merged into one.
+INDEX_MAX_SEGMENTS = 8
+
+
 def _hash(text):
     """Return a hash of the given text for use as an id.
 
     Currently SHA1 hashing is used.  It should be plenty for our purposes.
 
     """
+    import hashlib
     return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
 def _task_from_taskline(taskline):
@@ -72,8 +95,338 @@ def _tasklines_from_tasks(tasks):
 
     return tasklines
 
+def _file_signature(path):
+    """Return the size, mtime and inode of a file, to detect changes."""
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+def _write_cache(path, tasks, signature):
+    """Write the parsed tasks of the task file at path to its cache file.
+
+    The cache is a marshal blob next to the task file (path + '.cache'),
+    tagged with the signature of the task file it was created from.  This
+    must be the signature taken before the file was read, so that a change
+    made while it was read invalidates the cache.  Failing to write the
+    cache is not an error, the task file just gets parsed next time.
+    """
+    cache_path = '%s.cache' % path
+    tmp_path = '%s.tmp' % cache_path
+    try:
+        data = (CACHE_VERSION, signature, list(tasks))
+        with open(tmp_path, 'wb') as cfile:
+            cfile.write(marshal.dumps(data))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+def _end_last_line(path):
+    """Append a newline to the file at path unless it is empty or ends with one.
+
+    Task files edited by hand may lack the final newline, and anything
+    appended to them would otherwise continue their last line.
+    """
+    with open(path, 'rb+') as tfile:
+        tfile.seek(0, os.SEEK_END)
+        if tfile.tell() == 0:
+            return
+        tfile.seek(-1, os.SEEK_END)
+        if tfile.read(1) != b'\n':
+            tfile.write(b'\n')
+
+def _read_tasks(path):
+    """Return the list of tasks in the task file at path.
+
+    If the cache file of the task file is still fresh, i.e. the task file has
+    the same size, mtime and inode as when the cache was written, the tasks
+    are taken from the cache.  Otherwise the task file is parsed and the
+    cache is rewritten.
+    """
+    signature = _file_signature(path)
+    try:
+        with open('%s.cache' % path, 'rb') as cfile:
+            version, cached_signature, tasks = marshal.loads(cfile.read())
+        if version == CACHE_VERSION and cached_signature == signature:
+            return tasks
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    with open(path, 'r') as tfile:
+        tls = [tl.strip() for tl in tfile if tl]
+        tasks = list(map(_task_from_taskline, tls))
+    _write_cache(path, tasks, signature)
+    return tasks
+
+def _trigrams(text):
+    """Return the set of lowercase trigrams of the given text."""
+    text = text.lower()
+    return set(text[i:i+3] for i in range(len(text) - 2))
+
+
+class _GrepIndex(object):
+    """A trigram index over the lines of a task file, used for done files.
+
+    The index maps each trigram of the summary text of a taskline to the
+    byte offsets of the lines containing it.  It is stored next to the task
+    file (path + '.index') as a sequence of segments, each covering a range
+    of the task file.  The index is only used if the task file has exactly
+    the size, mtime and inode recorded in the last segment, and is rebuilt
+    from scratch otherwise.  When compact() appends to the done file, it
+    indexes only the appended lines, as a new segment appended to the index
+    file (see extend), so the index of the ever-growing done file is not
+    rebuilt on every compaction.
+
+    Offsets are stored as unsigned 32-bit integers, which limits indexed
+    task files to 4 GB.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index_path = '%s.index' % path
+        self._segments = None
+
+    def candidates(self, terms):
+        """Return the sorted offsets of the lines that may contain all terms.
+
+        Each returned line contains every trigram of every term, but the
+        caller still has to check the actual text.  Return None if none of
+        the terms is long enough to be looked up in the index.
+
+        """
+        grams = set()
+        for term in terms:
+            grams |= _trigrams(term)
+        if not grams:
+            return None
+        if self._segments is None:
+            self._segments = self._load()
+        postings = []
+        for gram in grams:
+            offsets = array('I')
+            for segment in self._segments:
+                offsets.frombytes(segment[-1].get(gram, b''))
+            if not offsets:
+                return []
+            postings.append(offsets)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for offsets in postings[1:]:
+            result.intersection_update(offsets)
+        return sorted(result)
+
+    def lines(self, offsets):
+        """Generate the lines of the task file at the given offsets."""
+        with open(self.path, 'rb') as tfile:
+            for offset in offsets:
+                tfile.seek(offset)
+                yield tfile.readline().decode('utf-8')
+
+    def extend(self, old_st):
+        """Index the lines appended to the task file since it had stat old_st.
+
+        This must only be called by the code that made the append.  If the
+        index did not describe the task file before the append, it is left
+        alone and rebuilt when it is used next.
+
+        """
+        segments = self._read()
+        if not self._is_valid(segments, old_st):
+            return
+        st = os.stat(self.path)
+        segment = self._build_segment(segments[-1][3], st)
+        segments.append(segment)
+        if len(segments) > INDEX_MAX_SEGMENTS:
+            self._write([self._merge(segments)], 'wb')
+        else:
+            self._write([segment], 'ab')
+
+    def _load(self):
+        """Return the up-to-date segments, rebuilding the index if needed."""
+        st = os.stat(self.path)
+        segments = self._read()
+        if not self._is_valid(segments, st):
+            segments = [self._build_segment(0, st)]
+            self._write(segments, 'wb')
+        return segments
+
+    def _read(self):
+        """Return the segments in the index file, or [] if it is unusable."""
+        segments = []
+        try:
+            with open(self.index_path, 'rb') as ifile:
+                data = ifile.read()
+            pos = 0
+            while pos < len(data):
+                length, = struct.unpack_from('<I', data, pos)
+                segments.append(marshal.loads(data[pos+4:pos+4+length]))
+                pos += 4 + length
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            segments = []
+        return segments
+
+    def _is_valid(self, segments, st):
+        """Check if the segments describe the task file with stat st."""
+        if not segments:
+            return False
+        expected_start = 0
+        for segment in segments:
+            if (len(segment) != 7 or segment[0] != INDEX_VERSION or
+                    segment[1] != st.st_ino or segment[2] != expected_start):
+                return False
+            expected_start = segment[3]
+        size, mtime = segments[-1][4:6]
+        return size == st.st_size and mtime == st.st_mtime_ns
+
+    def _build_segment(self, start, st):
+        """Index the lines of the task file from offset start on.
+
+        A last line without a newline is indexed too; compact() ends it
+        before appending to the file.  st is the stat of the task file, taken
+        before it is read, so that the segment is not trusted if the file
+        changes while being read.
+
+        """
+        postings = {}
+        end = start
+        with open(self.path, 'rb') as tfile:
+            tfile.seek(start)
+            for line in tfile:
+                text = line.decode('utf-8').partition('|')[0]
+                for gram in _trigrams(text):
+                    postings.setdefault(gram, array('I')).append(end)
+                end += len(line)
+        postings = dict((gram, offsets.tobytes())
+                        for gram, offsets in postings.items())
+        return (INDEX_VERSION, st.st_ino, start, end, st.st_size,
+                st.st_mtime_ns, postings)
+
+    def _merge(self, segments):
+        """Return a single segment covering all the given segments."""
+        postings = {}
+        for segment in segments:
+            for gram, offsets in segment[-1].items():
+                postings[gram] = postings.get(gram, b'') + offsets
+        first, last = segments[0], segments[-1]
+        return first[:3] + last[3:6] + (postings,)
+
+    def _write(self, segments, mode):
+        """Write segments to the index file, replacing it if mode is 'wb'.
+
+        Failing to write the index is not an error, it is just built again
+        next time.
+        """
+        try:
+            path = self.index_path if mode == 'ab' else '%s.tmp' % self.index_path
+            with open(path, mode) as ifile:
+                for segment in segments:
+                    blob = marshal.dumps(segment)
+                    ifile.write(struct.pack('<I', len(blob)))
+                    ifile.write(blob)
+            if mode == 'wb':
+                os.replace(path, self.index_path)
+        except OSError:
+            pass
+
+
+def _common_prefix_length(a, b):
+    """Return the length of the longest common prefix of a and b."""
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class _PrefixIndex(object):
+    """A sorted set of ids supporting prefix lookups.
+
+    Sorting puts the ids sharing the longest prefix with a given id right
+    next to it, so the array plays the part of a compressed trie: finding
+    the ids starting with a prefix is a binary search, and the shortest
+    unique prefix of an id only depends on its two neighbours.
+
+    The mapping of all ids to their prefixes is computed on first use and
+    then kept up to date as ids are added and removed, which only affects
+    the prefixes of the neighbours of the changed id.
+
+    """
+    def __init__(self, ids=()):
+        self._ids = sorted(ids)
+        self._prefixes = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, id):
+        """Add an id that is not in the index yet."""
+        i = bisect_left(self._ids, id)
+        self._ids.insert(i, id)
+        self._update(i - 1, i + 2)
+
+    def remove(self, id):
+        """Remove an id from the index."""
+        i = bisect_left(self._ids, id)
+        del self._ids[i]
+        if self._prefixes is not None:
+            del self._prefixes[id]
+        self._update(i - 1, i + 1)
+
+    def _update(self, start, end):
+        """Recompute the cached prefixes of the ids in ids[start:end]."""
+        if self._prefixes is not None:
+            for i in range(max(start, 0), min(end, len(self._ids))):
+                self._prefixes[self._ids[i]] = self._prefix_at(i)
+
+    def _prefix_at(self, i):
+        """Return the shortest unique prefix of the id at position i."""
+        ids = self._ids
+        id = ids[i]
+        length = 0
+        if i > 0:
+            length = _common_prefix_length(id, ids[i-1])
+        if i + 1 < len(ids):
+            length = max(length, _common_prefix_length(id, ids[i+1]))
+        return id[:length+1]
+
+    def lookup(self, prefix):
+        """Return the id with the given prefix.
+
+        If more than one id matches the prefix an AmbiguousPrefix exception
+        will be raised, unless the prefix is an entire id.
+
+        If no ids match the prefix an UnknownPrefix exception will be raised.
+
+        """
+        ids = self._ids
+        i = bisect_left(ids, prefix)
+        if i == len(ids) or not ids[i].startswith(prefix):
+            raise UnknownPrefix(prefix)
+        if i + 1 < len(ids) and ids[i+1].startswith(prefix):
+            # An exact match sorts before all longer ids sharing its prefix.
+            if ids[i] != prefix:
+                raise AmbiguousPrefix(prefix)
+        return ids[i]
+
+    def prefix(self, id):
+        """Return the shortest prefix identifying the given id."""
+        if self._prefixes is not None:
+            return self._prefixes[id]
+        return self._prefix_at(bisect_left(self._ids, id))
+
+    def prefixes(self):
+        """Return a mapping of all ids to their shortest unique prefixes.
+
+        The mapping is owned by the index and must not be modified.
+        """
+        if self._prefixes is None:
+            self._prefixes = dict((id, self._prefix_at(i))
+                                  for i, id in enumerate(self._ids))
+        return self._prefixes
+
+
 def _prefixes(ids):
-    """Return a mapping of ids to prefixes in O(n) time.
+    """Return a mapping of ids to prefixes in O(n log n) time.
 
     Each prefix will be the shortest possible substring of the ID that
     can uniquely identify it among the given group of IDs.
@@ -81,35 +434,7 @@ def _prefixes(ids):
     If an ID of one task is entirely a substring of another task's ID, the
     entire ID will be the prefix.
     """
-    ps = {}
-    for id in ids:
-        id_len = len(id)
-        for i in range(1, id_len+1):
-            # identifies an empty prefix slot, or a singular collision
-            prefix = id[:i]
-            if (not prefix in ps) or (ps[prefix] and prefix != ps[prefix]):
-                break
-        if prefix in ps:
-            # if there is a collision
-            other_id = ps[prefix]
-            for j in range(i, id_len+1):
-                if other_id[:j] == id[:j]:
-                    ps[id[:j]] = ''
-                else:
-                    ps[other_id[:j]] = other_id
-                    ps[id[:j]] = id
-                    break
-            else:
-                ps[other_id[:id_len+1]] = other_id
-                ps[id] = id
-        else:
-            # no collision, can safely add
-            ps[prefix] = id
-    ps = dict(zip(ps.values(), ps.keys()))
-    if '' in ps:
-        del ps['']
-    return ps
-
+    return dict(_PrefixIndex(ids).prefixes())
 
 class TaskDict(object):
     """A set of tasks, both finished and unfinished, for a given list.
@@ -117,24 +442,110 @@ class TaskDict(object):
     The list's files are read from disk when the TaskDict is initialized. They
     can be written back out to disk with the write() function.
 
+    Changes are not written to the task files directly but appended to a
+    journal file (LIST.journal), which is replayed over the task files when
+    they are read.  Once the journal grows beyond JOURNAL_COMPACT_THRESHOLD
+    entries, or when compact() is called, the task files are rewritten and
+    the journal is removed, so the task files stay editable by hand.
+
+    The finished tasks are only read when the done attribute is first used.
+    Tasks finished since then are collected separately and appended to the
+    done file on compaction, so the done file is never rewritten.
+
+    A journal line is either "task <taskline>", which adds an unfinished task
+    or replaces the one with the same id, or "done <id>", which marks the
+    unfinished task with that id as finished.
+
+    The ids of the unfinished tasks are also kept in a _PrefixIndex, so that
+    looking up a task by prefix is a binary search rather than a scan.
+
+    Searching the finished tasks uses a trigram index of the done file (see
+    _GrepIndex), so that it does not have to be read in full.  The
+    unfinished tasks are all in memory anyway and are searched directly.
+
     """
+    # Whether write() compacts the journal once it is large enough.  The
+    # server turns this off and compacts while it is idle instead.
+    auto_compact = True
+
     def __init__(self, taskdir='.', name='tasks'):
         """Initialize by reading the task files, if they exist."""
         self.tasks = {}
-        self.done = {}
         self.name = name
         self.taskdir = taskdir
-        filemap = (('tasks', self.name), ('done', '%s.done' % self.name))
-        for kind, filename in filemap:
-            path = os.path.join(os.path.expanduser(self.taskdir), filename)
+        self._done = None
+        self._finished = []
+        self._journal = []
+        self._journal_length = 0
+        path = self._path(self.name)
+        if os.path.isdir(path):
+            raise InvalidTaskfile
+        if os.path.exists(path):
+            for task in _read_tasks(path):
+                self.tasks[task['id']] = task
+        self._replay_journal()
+        self._index = _PrefixIndex(self.tasks)
+
+    def _path(self, filename):
+        """Return the path of one of the files of this list."""
+        return os.path.join(os.path.expanduser(self.taskdir), filename)
+
+    def _replay_journal(self):
+        """Apply the entries of the journal file to the loaded tasks.
+
+        An incomplete last entry, left by an interrupted write, is cut off
+        the file, so that the next entry appended does not continue it.
+
+        """
+        path = self._path('%s.journal' % self.name)
+        if not os.path.isfile(path):
+            return
+        with open(path, 'rb') as jfile:
+            end = 0
+            for line in jfile:
+                if not line.endswith(b'\n'):
+                    os.truncate(path, end)
+                    break
+                end += len(line)
+                self._journal_length += 1
+                op, _, arg = line.decode('utf-8').strip().partition(' ')
+                if op == 'task':
+                    task = _task_from_taskline(arg)
+                    self.tasks[task['id']] = task
+                elif op == 'done' and arg in self.tasks:
+                    self._finished.append(self.tasks.pop(arg))
+
+    @property
+    def done(self):
+        """The finished tasks, read from the done file on first use."""
+        if self._done is None:
+            self._done = {}
+            path = self._path('%s.done' % self.name)
             if os.path.isdir(path):
                 raise InvalidTaskfile
             if os.path.exists(path):
-                with open(path, 'r') as tfile:
-                    tls = [tl.strip() for tl in tfile if tl]
-                    tasks = map(_task_from_taskline, tls)
-                    for task in tasks:
-                        getattr(self, kind)[task['id']] = task
+                for task in _read_tasks(path):
+                    self._done[task['id']] = task
+            for task in self._finished:
+                self._done[task['id']] = task
+        return self._done
+
+    def _iter_done(self):
+        """Generate the finished tasks without keeping them all in memory.
+
+        The done file is streamed line by line, followed by the tasks that
+        have been finished since it was last written.
+
+        """
+        path = self._path('%s.done' % self.name)
+        if os.path.isdir(path):
+            raise InvalidTaskfile
+        if os.path.exists(path):
+            with open(path, 'r') as tfile:
+                for tl in tfile:
+                    yield _task_from_taskline(tl.strip())
+        for task in self._finished:
+            yield task
 
     def __getitem__(self, prefix):
         """Return the unfinished task with the given prefix.
@@ -145,22 +556,25 @@ class TaskDict(object):
         If no tasks match the prefix an UnknownPrefix exception will be raised.
 
         """
-        matched = list(filter(lambda tid: tid.startswith(prefix), self.tasks.keys()))
-        if len(matched) == 1:
-            return self.tasks[matched[0]]
-        elif len(matched) == 0:
-            raise UnknownPrefix(prefix)
-        else:
-            matched = filter(lambda tid: tid == prefix, self.tasks.keys())
-            if len(matched) == 1:
-                return self.tasks[matched[0]]
-            else:
-                raise AmbiguousPrefix(prefix)
+        return self.tasks[self._index.lookup(prefix)]
+
+    def _add_open(self, task):
+        """Add a task to the unfinished tasks, keeping the index sorted."""
+        if task['id'] not in self.tasks:
+            self._index.add(task['id'])
+        self.tasks[task['id']] = task
+
+    def _remove_open(self, task_id):
+        """Remove and return the unfinished task with the given id."""
+        self._index.remove(task_id)
+        return self.tasks.pop(task_id)
 
     def add_task(self, text):
         """Add a new, unfinished task with the given summary text."""
         task_id = _hash(text)
-        self.tasks[task_id] = {'id': task_id, 'text': text}
+        task = {'id': task_id, 'text': text}
+        self._add_open(task)
+        self._journal.append('task %s' % _tasklines_from_tasks([task])[0])
 
     def edit_task(self, prefix, text):
         """Edit the task with the given prefix.
@@ -173,11 +587,13 @@ class TaskDict(object):
         """
         task = self[prefix]
         if text.startswith('s/') or text.startswith('/'):
+            import re
             text = re.sub('^s?/', '', text).rstrip('/')
             find, _, repl = text.partition('/')
             text = re.sub(find, repl, task['text'])
 
         task['text'] = text
+        self._journal.append('task %s' % _tasklines_from_tasks([task])[0])
 
     def finish_task(self, prefix):
         """Mark the task with the given prefix as finished.
@@ -187,42 +603,273 @@ class TaskDict(object):
         be raised.
 
         """
-        task = self.tasks.pop(self[prefix]['id'])
-        self.done[task['id']] = task
+        task = self._remove_open(self[prefix]['id'])
+        self._finished.append(task)
+        if self._done is not None:
+            self._done[task['id']] = task
+        self._journal.append('done %s\n' % task['id'])
+
+    def _grep_tasks(self, terms):
+        """Return the unfinished tasks whose text contains all terms.
+
+        The terms must be lowercase.
+
+        """
+        def matches(task):
+            text = task['text'].lower()
+            return all(term in text for term in terms)
+        return [task for task in self.tasks.values() if matches(task)]
+
+    def _grep_done(self, terms):
+        """Generate the finished tasks whose text contains all terms.
+
+        The terms must be lowercase.  Only the lines of the done file that
+        the index lists as candidates are read.
+
+        """
+        def matches(task):
+            text = task['text'].lower()
+            return all(term in text for term in terms)
+        path = self._path('%s.done' % self.name)
+        if os.path.isdir(path):
+            raise InvalidTaskfile
+        offsets = None
+        if os.path.isfile(path):
+            index = _GrepIndex(path)
+            offsets = index.candidates(terms)
+        if offsets is None:
+            tasks = self._iter_done()
+        else:
+            tasks = (_task_from_taskline(line.strip())
+                     for line in index.lines(offsets))
+            tasks = itertools.chain(tasks, self._finished)
+        return (task for task in tasks if matches(task))
+
+    def print_list(self, kind='tasks', verbose=False, quiet=False, grep='',
+                   words=()):
+        """Print out a nicely formatted list of tasks."""
+        for line in self.format_list(kind, verbose, quiet, grep, words):
+            print(line)
+
+    def format_list(self, kind='tasks', verbose=False, quiet=False, grep='',
+                    words=()):
+        """Generate the lines of a nicely formatted list of tasks.
+
+        If grep or words are given, only the tasks whose text contains grep
+        and each of the words are listed, ignoring case.
+
+        Finished tasks are streamed from the done file in the order in which
+        they were finished.  They cannot be referred to by prefix, so they
+        are printed with their full id if verbose is set, and without an id
+        otherwise.
+
+        """
+        terms = [term.lower() for term in [grep] + list(words) if term]
+        if kind == 'done':
+            seen = set()
+            if terms:
+                tasks = self._grep_done(terms)
+            else:
+                tasks = self._iter_done()
+            for task in tasks:
+                if task['id'] in seen:
+                    continue
+                seen.add(task['id'])
+                p = '%s - ' % task['id'] if verbose and not quiet else ''
+                yield p + task['text']
+            return
 
-    def print_list(self, kind='tasks', verbose=False, quiet=False, grep=''):
-        """Print out a nicely formatted list of unfinished tasks."""
-        tasks = dict(getattr(self, kind).items())
-        label = 'prefix' if not verbose else 'id'
+        if terms:
+            tasks = self._grep_tasks(terms)
+        else:
+            tasks = self.tasks.values()
 
-        if not verbose:
-            for task_id, prefix in _prefixes(tasks).items():
-                tasks[task_id]['prefix'] = prefix
+        if verbose:
+            lines = [(task['id'], task['id'], task['text']) for task in tasks]
+        elif terms:
+            prefix = self._index.prefix
+            lines = [(task['id'], prefix(task['id']), task['text'])
+                     for task in tasks]
+        else:
+            ps = self._index.prefixes()
+            lines = [(task['id'], ps[task['id']], task['text'])
+                     for task in tasks]
 
-        plen = max(map(lambda t: len(t[label]), tasks.values())) if tasks else 0
-        for _, task in sorted(tasks.items()):
-            if grep.lower() in task['text'].lower():
-                p = '%s - ' % task[label].ljust(plen) if not quiet else ''
-                print(p + task['text'])
+        plen = max(len(line[1]) for line in lines) if lines else 0
+        for _, label, text in sorted(lines):
+            p = '%s - ' % label.ljust(plen) if not quiet else ''
+            yield p + text
 
     def write(self, delete_if_empty=False):
-        """Flush the finished and unfinished tasks to the files on disk."""
-        filemap = (('tasks', self.name), ('done', '%s.done' % self.name))
-        for kind, filename in filemap:
-            path = os.path.join(os.path.expanduser(self.taskdir), filename)
+        """Flush the changes to the finished and unfinished tasks to disk.
+
+        The changes are appended to the journal, unless it has grown large
+        enough to be compacted and auto_compact is set.  Compaction is also
+        forced if the task file is to be deleted because there are no
+        unfinished tasks left.
+
+        """
+        if ((self.auto_compact and self.needs_compaction()) or
+                (delete_if_empty and not self.tasks)):
+            self.compact(delete_if_empty)
+        elif self._journal:
+            path = self._path('%s.journal' % self.name)
             if os.path.isdir(path):
                 raise InvalidTaskfile
-            tasks = sorted(getattr(self, kind).values(), key=itemgetter('id'))
-            if tasks or not delete_if_empty:
-                with open(path, 'w') as tfile:
-                    for taskline in _tasklines_from_tasks(tasks):
-                        tfile.write(taskline)
-            elif not tasks and os.path.isfile(path):
-                os.remove(path)
+            with open(path, 'a') as jfile:
+                jfile.write(''.join(self._journal))
+            self._journal_length += len(self._journal)
+            self._journal = []
+
+    def needs_compaction(self):
+        """Return True if the journal has grown beyond its threshold."""
+        return (self._journal_length + len(self._journal) >
+                JOURNAL_COMPACT_THRESHOLD)
+
+    def compact(self, delete_if_empty=False):
+        """Rewrite the task file from memory and remove the journal.
+
+        The newly finished tasks are appended to the done file and synced
+        first.  Then the task file is written to a temporary file and renamed
+        over the old one, so an interrupted compaction leaves either the old
+        or the new file in place.  The journal is only removed at the end.
+        If compaction stops before that, replaying the journal over the old
+        task file finishes the same tasks again, so at worst a finished task
+        appears twice in the done file, and only its last line counts.  A
+        finished task is never missing from both files.
+
+        """
+        path = self._path(self.name)
+        if os.path.isdir(path):
+            raise InvalidTaskfile
+        if self._finished:
+            done_path = self._path('%s.done' % self.name)
+            if os.path.isdir(done_path):
+                raise InvalidTaskfile
+            old_st = None
+            if os.path.isfile(done_path):
+                old_st = os.stat(done_path)
+                _end_last_line(done_path)
+            with open(done_path, 'a') as tfile:
+                for taskline in _tasklines_from_tasks(self._finished):
+                    tfile.write(taskline)
+                tfile.flush()
+                os.fsync(tfile.fileno())
+            self._finished = []
+            if old_st is not None:
+                _GrepIndex(done_path).extend(old_st)
+        tasks = sorted(self.tasks.values(), key=itemgetter('id'))
+        if tasks or not delete_if_empty:
+            tmp_path = '%s.tmp' % path
+            with open(tmp_path, 'w') as tfile:
+                for taskline in _tasklines_from_tasks(tasks):
+                    tfile.write(taskline)
+                tfile.flush()
+                os.fsync(tfile.fileno())
+            # Renaming keeps the size, mtime and inode of the file.
+            signature = _file_signature(tmp_path)
+            os.replace(tmp_path, path)
+            _write_cache(path, tasks, signature)
+        elif not tasks and os.path.isfile(path):
+            os.remove(path)
+        journal_path = self._path('%s.journal' % self.name)
+        if os.path.isfile(journal_path):
+            os.remove(journal_path)
+        self._journal = []
+        self._journal_length = 0
+
+def _list_names(taskdir):
+    """Return the sorted names of the lists in taskdir.
+
+    A list exists if any of its files exist, e.g. only its journal.
+    """
+    taskdir = os.path.expanduser(taskdir or '.')
+    names = set()
+    for filename in os.listdir(taskdir):
+        if (filename.startswith('.') or
+                not os.path.isfile(os.path.join(taskdir, filename))):
+            continue
+        name, ext = os.path.splitext(filename)
+        while ext in LIST_FILE_SUFFIXES:
+            filename = name
+            name, ext = os.path.splitext(filename)
+        names.add(filename)
+    return sorted(names)
+
+def _format_named_list(args):
+    """Return the formatted lines of one list, for use in a process pool."""
+    taskdir, name, kwargs = args
+    return list(TaskDict(taskdir=taskdir, name=name).format_list(**kwargs))
+
+def print_all_lists(taskdir='.', **kwargs):
+    """Print the tasks of all lists in taskdir, tagged with the list name.
+
+    The lists are loaded and searched in parallel by a process pool.  The
+    keyword arguments are passed on to TaskDict.format_list, so prefixes
+    are unique within each list.
+
+    """
+    names = _list_names(taskdir)
+    if not names:
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = [(taskdir, name, kwargs) for name in names]
+    with ProcessPoolExecutor() as pool:
+        results = pool.map(_format_named_list, jobs)
+        width = max(len(name) for name in names)
+        for name, lines in zip(names, results):
+            for line in lines:
+                print('%s %s' % (('%s:' % name).ljust(width + 1), line))
+
+def _run_batch(td, bfile):
+    """Apply the commands read from bfile to the TaskDict td.
+
+    Each line is one of the following commands:
 
+        add TEXT
+        edit TASK TEXT
+        finish TASK
+
+    Blank lines and lines starting with '#' are ignored.  A command that
+    fails is reported on stderr together with its line number, and the
+    remaining commands are still applied.  Return the number of failures.
+
+    """
+    import re
+    errors = 0
+    for lineno, line in enumerate(bfile, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        command, _, rest = line.partition(' ')
+        rest = rest.strip()
+        try:
+            if command == 'add' and rest:
+                td.add_task(rest)
+            elif command == 'edit' and ' ' in rest:
+                prefix, _, text = rest.partition(' ')
+                td.edit_task(prefix, text.strip())
+            elif command == 'finish' and rest:
+                td.finish_task(rest)
+            else:
+                raise ValueError(line)
+        except AmbiguousPrefix as e:
+            sys.stderr.write('line %d: The ID "%s" matches more than one '
+                             'task.\n' % (lineno, e.prefix))
+            errors += 1
+        except UnknownPrefix as e:
+            sys.stderr.write('line %d: The ID "%s" does not match any '
+                             'task.\n' % (lineno, e.prefix))
+            errors += 1
+        except (ValueError, re.error):
+            sys.stderr.write('line %d: Invalid command "%s".\n'
+                             % (lineno, line))
+            errors += 1
+    return errors
 
 def _build_parser():
     """Return a parser for the command-line interface."""
+    from optparse import OptionParser, OptionGroup
     usage = "Usage: %prog [-d DIR] [-l LIST] [options] [TEXT]"
     parser = OptionParser(usage=usage)
 
@@ -232,11 +879,25 @@ def _build_parser():
                        help="edit TASK to contain TEXT", metavar="TASK")
     actions.add_option("-f", "--finish", dest="finish",
                        help="mark TASK as finished", metavar="TASK")
+    actions.add_option("-b", "--batch", dest="batch",
+                       help="apply the add, edit and finish commands in FILE "
+                            "('-' for stdin); exit with status 1 if any of "
+                            "them fails", metavar="FILE")
+    actions.add_option("-c", "--compact",
+                       action="store_true", dest="compact", default=False,
+                       help="rewrite the task files and remove the journal")
+    actions.add_option("--serve",
+                       action="store_true", dest="serve", default=False,
+                       help="keep the lists in DIR in memory and answer t "
+                            "calls for them until interrupted")
     parser.add_option_group(actions)
 
     config = OptionGroup(parser, "Configuration Options")
     config.add_option("-l", "--list", dest="name", default="tasks",
                       help="work on LIST", metavar="LIST")
+    config.add_option("-a", "--all-lists",
+                      action="store_true", dest="all_lists", default=False,
+                      help="print the tasks of all lists in DIR")
     config.add_option("-t", "--task-dir", dest="taskdir", default="",
                       help="work on the lists in DIR", metavar="DIR")
     config.add_option("-d", "--delete-if-empty",
@@ -245,8 +906,14 @@ def _build_parser():
     parser.add_option_group(config)
 
     output = OptionGroup(parser, "Output Options")
+    output.add_option("--done",
+                      action="store_true", dest="done", default=False,
+                      help="print the finished tasks instead")
     output.add_option("-g", "--grep", dest="grep", default='',
                       help="print only tasks that contain WORD", metavar="WORD")
+    output.add_option("-m", "--match", dest="match", default='',
+                      help="print only tasks that contain all of WORDS",
+                      metavar="WORDS")
     output.add_option("-v", "--verbose",
                       action="store_true", dest="verbose", default=False,
                       help="print more detailed output (full task ids, etc)")
@@ -257,15 +924,51 @@ def _build_parser():
 
     return parser
 
-def _main():
-    """Run the command-line interface."""
-    (options, args) = _build_parser().parse_args()
+def _run(argv, cwd=None, stdin=None, load=None):
+    """Run the command-line interface for the given arguments.
+
+    A relative task directory or batch file is taken relative to cwd, and
+    batch commands from '-' are read from stdin; both default to those of
+    the current process.  Lists are obtained by calling load(taskdir, name),
+    which defaults to creating a TaskDict.
 
-    td = TaskDict(taskdir=options.taskdir, name=options.name)
+    """
+    parser = _build_parser()
+    (options, args) = parser.parse_args(argv)
+    cwd = cwd or os.getcwd()
+    taskdir = os.path.join(cwd, os.path.expanduser(options.taskdir))
+    load = load or (lambda taskdir, name: TaskDict(taskdir, name))
+
+    if options.serve:
+        _TaskServer(taskdir).serve_forever()
+        return
+
+    if options.all_lists:
+        if args or options.batch or options.compact or options.edit or \
+                options.finish:
+            parser.error("--all-lists can only be used for printing tasks")
+        kind = 'done' if options.done else 'tasks'
+        print_all_lists(taskdir, kind=kind, verbose=options.verbose,
+                        quiet=options.quiet, grep=options.grep,
+                        words=options.match.split())
+        return
+
+    td = load(taskdir, options.name)
     text = ' '.join(args).strip()
 
     try:
-        if options.finish:
+        if options.batch:
+            if options.batch == '-':
+                errors = _run_batch(td, stdin or sys.stdin)
+            else:
+                with open(os.path.join(cwd, options.batch), 'r') as bfile:
+                    errors = _run_batch(td, bfile)
+            td.write(options.delete)
+            if errors:
+                sys.exit(1)
+        elif options.compact:
+            td.compact(options.delete)
+        elif options.finish:
             td.finish_task(options.finish)
             td.write(options.delete)
         elif options.edit:
@@ -275,13 +978,233 @@ def _main():
             td.add_task(text)
             td.write(options.delete)
         else:
-            td.print_list(verbose=options.verbose, quiet=options.quiet,
-                          grep=options.grep)
+            kind = 'done' if options.done else 'tasks'
+            td.print_list(kind=kind, verbose=options.verbose,
+                          quiet=options.quiet, grep=options.grep,
+                          words=options.match.split())
     except AmbiguousPrefix as e:
         sys.stderr.write('The ID "%s" matches more than one task.' % e.prefix)
     except UnknownPrefix as e:
         sys.stderr.write('The ID "%s" does not match any task.' % e.prefix)
 
 
+def _socket_path(taskdir):
+    """Return the path of the server socket for a task directory."""
+    return os.path.join(os.path.expanduser(taskdir or '.'), '.t.sock')
+
+def _scan_args(argv):
+    """Find the task directory and whether stdin is needed in argv.
+
+    This is a rough scan that avoids building the real parser.  If it gets
+    the task directory wrong the server either is not found, in which case
+    t runs in-process, or the server parses argv properly anyway.
+
+    """
+    taskdir, needs_stdin = '', False
+    for i, arg in enumerate(argv):
+        if arg == '--':
+            break
+        value = argv[i+1] if i + 1 < len(argv) else None
+        if arg in ('-t', '--task-dir') and value is not None:
+            taskdir = value
+        elif arg.startswith('--task-dir='):
+            taskdir = arg.partition('=')[2]
+        elif arg.startswith('-t') and not arg.startswith('--'):
+            taskdir = arg[2:]
+        elif (arg in ('-b', '--batch') and value == '-' or
+                arg in ('-b-', '--batch=-')):
+            needs_stdin = True
+    return taskdir, needs_stdin
+
+def _call_server(argv):
+    """Have a running server execute the command line argv.
+
+    Return the exit status, or None if no server is running for the task
+    directory, in which case the command has not been executed.
+
+    """
+    taskdir, needs_stdin = _scan_args(argv)
+    path = _socket_path(taskdir)
+    if not os.path.exists(path):
+        return None
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        request = {'argv': argv, 'cwd': os.getcwd(),
+                   'stdin': sys.stdin.read() if needs_stdin else ''}
+        try:
+            sock.sendall(marshal.dumps(request))
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            status, out, err = marshal.loads(b''.join(chunks))
+        except (OSError, EOFError, ValueError, TypeError):
+            # The server went away in the middle of the request.
+            sys.stderr.write('t: no answer from the server on %s; the '
+                             'command may or may not have run\n' % path)
+            return 1
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    return status
+
+
+class _TaskServer(object):
+    """A server keeping the lists of a task directory in memory.
+
+    The server listens on a Unix domain socket in the task directory and
+    answers one t call at a time, so the calls are serialized.  Each request
+    is the marshalled argv, working directory and stdin of a t call, and
+    each response its marshalled exit status, stdout and stderr.
+
+    Loaded lists are reused as long as their files are unchanged; if a file
+    was changed by anything other than the server, e.g. by hand or by a t
+    call that did not go through the server, the list is read again.
+    Changes are still appended to the journal right away, but compaction is
+    left for when the server has been idle for IDLE_SECONDS.
+
+    """
+    IDLE_SECONDS = 2
+
+    def __init__(self, taskdir):
+        self.taskdir = taskdir
+        self.path = _socket_path(taskdir)
+        self.lists = {}
+
+    def _signature(self, td):
+        """Return the signatures of all files of a list."""
+        signature = []
+        for suffix in ('', '.done', '.journal'):
+            path = td._path(td.name + suffix)
+            try:
+                signature.append(_file_signature(path))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def load(self, taskdir, name):
+        """Return the list, reading it again if its files have changed."""
+        key = (os.path.abspath(taskdir), name)
+        if key in self.lists:
+            td, signature = self.lists[key]
+            if self._signature(td) == signature:
+                return td
+        td = TaskDict(taskdir, name)
+        td.auto_compact = False
+        self.lists[key] = (td, None)
+        return td
+
+    def _update_signatures(self):
+        for key, (td, _) in self.lists.items():
+            self.lists[key] = (td, self._signature(td))
+
+    def compact_idle(self):
+        """Compact the journals that have grown beyond their threshold."""
+        for key, (td, signature) in list(self.lists.items()):
+            if self._signature(td) != signature:
+                del self.lists[key]
+            elif td.needs_compaction():
+                td.compact()
+        self._update_signatures()
+
+    def handle(self, conn):
+        """Answer the request of one connection."""
+        import io
+        from contextlib import redirect_stdout, redirect_stderr
+        chunks = []
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        if not chunks:
+            # Connections without a request only check for a running server.
+            return
+        request = marshal.loads(b''.join(chunks))
+        out, err = io.StringIO(), io.StringIO()
+        status = 0
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                if '--serve' in request['argv']:
+                    raise SystemExit('t: a server is already running')
+                _run(request['argv'], cwd=request['cwd'],
+                     stdin=io.StringIO(request['stdin']), load=self.load)
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    err.write(e.code + '\n')
+                    status = 1
+                else:
+                    status = e.code or 0
+            except Exception as e:
+                err.write('t: %s: %s\n' % (type(e).__name__, e))
+                status = 1
+        self._update_signatures()
+        conn.sendall(marshal.dumps((status, out.getvalue(), err.getvalue())))
+
+    def serve_forever(self):
+        """Answer requests until interrupted or terminated."""
+        import signal, socket
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self.path):
+            try:
+                sock.connect(self.path)
+            except OSError:
+                # Left behind by a server that did not shut down cleanly.
+                os.remove(self.path)
+            else:
+                sock.close()
+                sys.exit('t: a server is already running on %s' % self.path)
+        sock.bind(self.path)
+        try:
+            sock.listen()
+            sock.settimeout(self.IDLE_SECONDS)
+            while True:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    self.compact_idle()
+                    continue
+                with conn:
+                    conn.settimeout(None)
+                    try:
+                        self.handle(conn)
+                    except Exception as e:
+                        message = 't: cannot answer request: %s\n' % e
+                        sys.stderr.write(message)
+                        try:
+                            conn.sendall(marshal.dumps((1, '', message)))
+                        except OSError:
+                            pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.remove(self.path)
+            self.compact_idle()
+
+
+def _main():
+    """Run the command-line interface.
+
+    If a server is running for the task directory, it does the work.
+    """
+    status = None
+    if '--serve' not in sys.argv[1:]:
+        status = _call_server(sys.argv[1:])
+    if status is None:
+        _run(sys.argv[1:])
+    elif status:
+        sys.exit(status)
+
+
 if __name__ == '__main__':
     _main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+"""Benchmarks for t.py.
+
+The "suite" command generates synthetic task and done files of growing
+size, with and without metadata, and measures the wall time and peak
+memory of the main TaskDict operations and of complete t runs.  The
+results can be written as JSON and compared against an earlier run.
+
+The "done-history" command measures the time from starting t to having
+its output, for a fixed number of unfinished tasks and a growing history
+of finished tasks.
+
+The "check-prefixes" command compares the incrementally maintained
+prefixes of t._PrefixIndex against a brute-force computation on random
+sets of ids.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import t
+
+
+T_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "t.py")
+
+WORDS = ["buy", "milk", "write", "report", "fix", "bug", "call", "mom",
+         "review", "paper", "book", "flight", "clean", "kitchen", "pay",
+         "rent", "email", "team", "plan", "meeting", "read", "thesis"]
+
+
+def write_task_file(path, num_tasks, tag, metadata=True, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w") as tfile:
+        for i in range(num_tasks):
+            words = " ".join(rng.choice(WORDS) for _ in range(4))
+            text = f"{tag} task {i} {words}"
+            if metadata:
+                tfile.write(f"{text} | id:{t._hash(text)}\n")
+            else:
+                tfile.write(f"{text}\n")
+
+
+def remove_derived_files(taskdir):
+    """Remove caches, indexes and journals, leaving only the task files."""
+    for filename in os.listdir(taskdir):
+        if filename.endswith((".cache", ".index", ".journal", ".tmp")):
+            os.remove(os.path.join(taskdir, filename))
+
+
+def measure(func, setup=None):
+    """Return wall time and peak traced memory of calling func.
+
+    The function is run twice, once for timing and once under tracemalloc,
+    because tracing slows down allocation-heavy code considerably.
+    """
+    if setup:
+        setup()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def run_cli(taskdir, args):
+    """Run t in a child process and return its wall time and peak RSS."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, T_SCRIPT, "-t", taskdir] + args,
+                            stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    # ru_maxrss is in kilobytes on Linux.
+    return {"seconds": seconds, "peak_bytes": rusage.ru_maxrss * 1024}
+
+
+def quietly(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args, **kwargs)
+
+
+def benchmark_size(num_lines, metadata, num_lookups):
+    """Yield (benchmark name, measurement) pairs for one list size."""
+    with tempfile.TemporaryDirectory() as taskdir:
+        write_task_file(os.path.join(taskdir, "tasks"), num_lines, "open",
+                        metadata, seed=1)
+        write_task_file(os.path.join(taskdir, "tasks.done"), num_lines,
+                        "done", metadata, seed=2)
+
+        def clean():
+            remove_derived_files(taskdir)
+        load = lambda: t.TaskDict(taskdir)
+        yield "load cold", measure(load, clean)
+        yield "load cached", measure(load)
+
+        td = t.TaskDict(taskdir)
+        ids = list(td.tasks)
+        yield "_prefixes", measure(lambda: t._prefixes(ids))
+
+        rng = random.Random(3)
+        prefixes = [id[:7] for id in rng.sample(ids, min(num_lookups, len(ids)))]
+        def lookups():
+            for prefix in prefixes:
+                td[prefix]
+        result = measure(lookups)
+        result["seconds"] /= max(len(prefixes), 1)
+        result["operations"] = len(prefixes)
+        yield "__getitem__", result
+
+        yield "print_list", measure(lambda: quietly(td.print_list))
+        grep = lambda: quietly(td.print_list, grep="milk report")
+        yield "print_list grep", measure(grep)
+        grep_done = lambda: quietly(td.print_list, kind="done", grep="milk report")
+        yield "print_list done grep cold", measure(grep_done, clean)
+        yield "print_list done grep indexed", measure(grep_done)
+
+        def add_and_write():
+            td.add_task(f"benchmark task {rng.random()}")
+            td.write()
+        yield "add + write", measure(add_and_write)
+        def finish_and_compact():
+            td.finish_task(next(iter(td._index)))
+            td.compact()
+        yield "finish + compact", measure(finish_and_compact)
+
+        clean()
+        yield "cli list cold", run_cli(taskdir, [])
+        yield "cli list", run_cli(taskdir, [])
+        yield "cli grep", run_cli(taskdir, ["-g", "milk report"])
+        yield "cli add", run_cli(taskdir, ["benchmark", "task"])
+        yield "cli finish", run_cli(taskdir, ["-f", t._hash("benchmark task")])
+
+
+def run_suite(sizes, num_lookups):
+    results = []
+    for num_lines in sizes:
+        for metadata in (True, False):
+            for name, measurement in benchmark_size(num_lines, metadata,
+                                                    num_lookups):
+                record = {"benchmark": name, "lines": num_lines,
+                          "metadata": metadata}
+                record.update(measurement)
+                results.append(record)
+                print_record(record, file=sys.stderr)
+    return results
+
+
+def print_record(record, baseline=None, file=sys.stdout):
+    metadata = "meta" if record["metadata"] else "plain"
+    line = (f"{record['benchmark']:28} {record['lines']:>8} {metadata:5} "
+            f"{record['seconds']:10.4f}s {record['peak_bytes'] / 2**20:9.1f} MiB")
+    if baseline:
+        ratio = record["seconds"] / max(baseline["seconds"], 1e-9)
+        memory_ratio = record["peak_bytes"] / max(baseline["peak_bytes"], 1)
+        line += f"  time x{ratio:.2f}, memory x{memory_ratio:.2f}"
+    print(line, file=file)
+
+
+def record_key(record):
+    return (record["benchmark"], record["lines"], record["metadata"])
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(T_SCRIPT)).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(),
+            "machine": platform.machine(), "time": time.time()}
+
+
+def suite(args):
+    results = run_suite(args.sizes, args.lookups)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump({"environment": get_environment(), "results": results},
+                      outfile, indent=1)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = dict((record_key(record), record)
+                            for record in json.load(infile)["results"])
+    for record in results:
+        print_record(record, baseline.get(record_key(record)))
+
+
+def time_cli(taskdir, args, repetitions):
+    return min(run_cli(taskdir, args)["seconds"] for _ in range(repetitions))
+
+
+def benchmark_done_history(num_open, done_sizes, repetitions):
+    print(f"{'done':>9} {'list':>9} {'grep':>9} {'add':>9} {'finish':>9}")
+    for num_done in done_sizes:
+        with tempfile.TemporaryDirectory() as taskdir:
+            write_task_file(os.path.join(taskdir, "tasks"), num_open, "open")
+            write_task_file(os.path.join(taskdir, "tasks.done"), num_done, "done")
+            list_time = time_cli(taskdir, [], repetitions)
+            grep_time = time_cli(taskdir, ["-g", "task 1"], repetitions)
+            add_time = time_cli(taskdir, ["new", "task"], repetitions)
+            finish_time = time_cli(
+                taskdir, ["-f", t._hash("new task")], 1)
+        print(f"{num_done:9d} {list_time:9.3f} {grep_time:9.3f} "
+              f"{add_time:9.3f} {finish_time:9.3f}")
+
+
+def done_history(args):
+    benchmark_done_history(args.open, args.done, args.repetitions)
+
+
+def brute_force_prefixes(ids):
+    result = {}
+    for id in ids:
+        for length in range(1, len(id) + 1):
+            prefix = id[:length]
+            if not any(other != id and other.startswith(prefix)
+                       for other in ids):
+                break
+        result[id] = prefix
+    return result
+
+
+def check_prefix_index(trials):
+    for trial in range(trials):
+        # Short ids over a small alphabet make collisions likely, including
+        # ids that are prefixes of other ids.
+        alphabet = random.choice(["ab", "abc", "0123456789abcdef"])
+        max_length = random.randint(1, 6)
+        def random_id():
+            length = random.randint(1, max_length)
+            return "".join(random.choice(alphabet) for _ in range(length))
+        ids = set(random_id() for _ in range(random.randint(0, 20)))
+        index = t._PrefixIndex(ids)
+        index.prefixes()
+        for _ in range(random.randint(0, 20)):
+            id = random_id()
+            if id in ids:
+                ids.remove(id)
+                index.remove(id)
+            else:
+                ids.add(id)
+                index.add(id)
+            expected = brute_force_prefixes(ids)
+            assert index.prefixes() == expected, (ids, index.prefixes())
+            assert t._prefixes(ids) == expected, ids
+            for id in ids:
+                assert index.prefix(id) == expected[id], (ids, id)
+                assert index.lookup(expected[id]) == id, (ids, id)
+    print(f"{trials} random id sets checked")
+
+
+def check_prefixes(args):
+    check_prefix_index(args.trials)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    suite_parser = subparsers.add_parser("suite", help="run the benchmark suite")
+    suite_parser.add_argument("--sizes", type=int, nargs="+",
+                              default=[1000, 10000, 100000],
+                              help="numbers of lines of the task files "
+                                   "(up to 1000000)")
+    suite_parser.add_argument("--lookups", type=int, default=1000,
+                              help="number of prefix lookups to time")
+    suite_parser.add_argument("--output", metavar="FILE",
+                              help="write the results to FILE as JSON")
+    suite_parser.add_argument("--compare", metavar="FILE",
+                              help="compare against the JSON results in FILE")
+    suite_parser.set_defaults(func=suite)
+
+    history_parser = subparsers.add_parser(
+        "done-history", help="time t runs for a growing done file")
+    history_parser.add_argument("--open", type=int, default=1000,
+                                help="number of unfinished tasks")
+    history_parser.add_argument("--done", type=int, nargs="+",
+                                default=[0, 10000, 50000, 250000],
+                                help="numbers of finished tasks to try")
+    history_parser.add_argument("--repetitions", type=int, default=3,
+                                help="report the best of this many runs")
+    history_parser.set_defaults(func=done_history)
+
+    check_parser = subparsers.add_parser(
+        "check-prefixes", help="check prefix computation on random id sets")
+    check_parser.add_argument("trials", type=int, nargs="?", default=1000)
+    check_parser.set_defaults(func=check_prefixes)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
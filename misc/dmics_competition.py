@@ -1,10 +1,22 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import csv
+import hashlib
 import heapq
 import itertools
+import json
+import multiprocessing
+import os
+import re
+import resource
+import struct
+import sys
 import time
 
+import numpy as np
+
 
 VARIABLES = ["a", "b", "c", "d"]
 
@@ -12,6 +24,13 @@ TRUTH_TABLE_SIZE = 1 << len(VARIABLES)
 TRUTH_TABLE_MASK = (1 << TRUTH_TABLE_SIZE) - 1
 
 
+def set_num_variables(num_variables):
+    global VARIABLES, TRUTH_TABLE_SIZE, TRUTH_TABLE_MASK
+    VARIABLES = list("abcde"[:num_variables])
+    TRUTH_TABLE_SIZE = 1 << len(VARIABLES)
+    TRUTH_TABLE_MASK = (1 << TRUTH_TABLE_SIZE) - 1
+
+
 def log(text):
     print(f"[{time.process_time():.2f} sec] {text}")
 
@@ -109,6 +128,13 @@ class Biimplication(BinaryConnective):
         return (~(left ^ right)) & TRUTH_TABLE_MASK
 
 
+class Nand(BinaryConnective):
+    symbol = "\\uparrow"
+
+    def combine(self, left, right):
+        return ~(left & right) & TRUTH_TABLE_MASK
+
+
 def generate_atoms():
     for var in VARIABLES:
         yield Atom(var)
@@ -167,5 +193,1367 @@ def find_all_shortest():
     log(f"sum of sizes: {sum_of_sizes}")
 
 
+# Operator codes of the back-pointers of the array engine. For atoms,
+# the left child is the index of the variable; for implications, the
+# left child is the antecedent.
+OP_ATOM = 0
+OP_NEGATION = 1
+OP_CONJUNCTION = 2
+OP_DISJUNCTION = 3
+OP_BIIMPLICATION = 4
+OP_IMPLICATION = 5
+OP_NAND = 6
+
+OP_CLASSES = {
+    OP_CONJUNCTION: Conjunction,
+    OP_DISJUNCTION: Disjunction,
+    OP_BIIMPLICATION: Biimplication,
+    OP_IMPLICATION: Implication,
+    OP_NAND: Nand,
+}
+
+CLASS_OPS = {cls: op for op, cls in OP_CLASSES.items()}
+
+
+class CostModel:
+    """Costs of the atoms and connectives formulas may use.
+
+    A cost of None means that the connective may not be used. The default
+    costs are those of Formula.size, which counts every symbol including
+    the parentheses around binary connectives.
+    """
+
+    def __init__(self, name, atom=1, negation=1, conjunction=3,
+                 disjunction=3, biimplication=3, implication=3, nand=None):
+        self.name = name
+        self.atom = atom
+        self.negation = negation
+        costs = {
+            OP_CONJUNCTION: conjunction,
+            OP_DISJUNCTION: disjunction,
+            OP_BIIMPLICATION: biimplication,
+            OP_IMPLICATION: implication,
+            OP_NAND: nand,
+        }
+        self.binary = {op: cost for op, cost in costs.items()
+                       if cost is not None}
+
+    def formula_size(self, formula):
+        if isinstance(formula, Atom):
+            return self.atom
+        if isinstance(formula, Negation):
+            return self.negation + self.formula_size(formula.subformula)
+        return (self.binary[CLASS_OPS[type(formula)]] +
+                self.formula_size(formula.lhs) +
+                self.formula_size(formula.rhs))
+
+
+COST_MODELS = {model.name: model for model in [
+    CostModel("standard"),
+    CostModel("unit", conjunction=1, disjunction=1, biimplication=1,
+              implication=1),
+    CostModel("no-biimplication", biimplication=None),
+    CostModel("no-implication", implication=None),
+    CostModel("and-or-not", biimplication=None, implication=None),
+    CostModel("nand-only", negation=None, conjunction=None,
+              disjunction=None, biimplication=None, implication=None, nand=3),
+]}
+
+UNKNOWN_SIZE = 255
+
+# Back-pointers are packed into 9 bytes per truth table.
+BACK_POINTER_DTYPE = np.dtype(
+    [("op", np.uint8), ("left", np.uint32), ("right", np.uint32)])
+
+# Bound on the number of Formula objects kept around for printing.
+MAX_CACHED_FORMULAS = 1 << 16
+
+# Increase when changing the contents of checkpoint files.
+CHECKPOINT_VERSION = 4
+
+# Symmetry lookup tables for all truth tables are only precomputed up to
+# this many bits per truth table (four variables).
+MAX_PRECOMPUTED_TRUTH_TABLE_SIZE = 16
+
+# Number of truth tables processed at once when resuming from a state
+# directory.
+RESUME_CHUNK_SIZE = 1 << 24
+
+# A result table consists of a header and one 10-byte record per truth
+# table, in the order of the truth tables.
+RESULTS_HEADER = struct.Struct("<8sII16s")
+RESULTS_MAGIC = b"DMICSRES"
+RESULTS_VERSION = 2
+RESULT_DTYPE = np.dtype([("size", np.uint8), ("op", np.uint8),
+                         ("left", np.uint32), ("right", np.uint32)])
+
+
+class Symmetry:
+    """Permutations of the variables, acting on truth tables.
+
+    Renaming the variables of a formula does not change its size, so it
+    suffices to search for the smallest formula of one representative
+    per class of truth tables that are equal up to a permutation of the
+    variables: the numerically smallest one. Each permutation maps truth
+    tables through precomputed lookup tables for chunks of up to eight
+    bits.
+
+    Negating inputs is not a symmetry here: replacing a variable by its
+    negation adds 1 to the size per occurrence.
+
+    With precompute, the images and representatives of all truth tables
+    are computed up front (up to four variables, where they take a few
+    MB), so that the other methods become lookups. They do not depend on
+    the cost model, so one Symmetry can serve the searches of a sweep.
+    """
+
+    def __init__(self, precompute=False):
+        self.perms = list(itertools.permutations(range(len(VARIABLES))))
+        self.chunk_bits = min(8, TRUTH_TABLE_SIZE)
+        num_chunks = TRUTH_TABLE_SIZE // self.chunk_bits
+        values = np.arange(1 << self.chunk_bits)
+        self.tables = np.zeros(
+            (len(self.perms), num_chunks, 1 << self.chunk_bits),
+            dtype=np.uint32)
+        for index, perm in enumerate(self.perms):
+            for position in range(TRUTH_TABLE_SIZE):
+                chunk, bit = divmod(position, self.chunk_bits)
+                target = self.permute_position(position, perm)
+                self.tables[index, chunk, (values >> bit) & 1 == 1] |= (
+                    np.uint32(1 << target))
+        self.image_table = None
+        if precompute and TRUTH_TABLE_SIZE <= MAX_PRECOMPUTED_TRUTH_TABLE_SIZE:
+            all_tts = np.arange(1 << TRUTH_TABLE_SIZE, dtype=np.uint32)
+            images = self.images(all_tts)
+            self.representative_perms = images.argmin(axis=0).astype(np.uint8)
+            self.representatives = images[self.representative_perms, all_tts]
+            self.image_table = images
+
+    @staticmethod
+    def permute_position(position, perm):
+        """Map a truth table position when variable i is renamed to perm[i].
+
+        As in all_interpretations, the first variable corresponds to the
+        most significant bit of a position.
+        """
+        num_variables = len(perm)
+        result = 0
+        for var in range(num_variables):
+            if (position >> (num_variables - 1 - var)) & 1:
+                result |= 1 << (num_variables - 1 - perm[var])
+        return result
+
+    def apply(self, perm, tts):
+        """Return the truth tables of tts with variables renamed by perm."""
+        if self.image_table is not None:
+            return self.image_table[perm, tts]
+        mask = (1 << self.chunk_bits) - 1
+        result = np.zeros(len(tts), dtype=np.uint32)
+        for chunk, table in enumerate(self.tables[perm]):
+            result |= table[(tts >> (chunk * self.chunk_bits)) & mask]
+        return result
+
+    def images(self, tts):
+        """Return an array of tts renamed by each permutation (one row
+        per permutation)."""
+        if self.image_table is not None:
+            return self.image_table[:, tts]
+        mask = (1 << self.chunk_bits) - 1
+        result = np.zeros((len(self.perms), len(tts)), dtype=np.uint32)
+        for chunk in range(self.tables.shape[1]):
+            result |= self.tables[:, chunk,
+                                  (tts >> (chunk * self.chunk_bits)) & mask]
+        return result
+
+    def apply_each(self, perms, tts):
+        """Rename the variables of each tts[i] by perms[i]."""
+        result = np.empty(len(tts), dtype=np.uint32)
+        for perm in np.unique(perms).tolist():
+            selected = perms == perm
+            result[selected] = self.apply(perm, tts[selected])
+        return result
+
+    def canonical(self, tts):
+        """Return the representatives of tts and the permutations mapping
+        tts to them."""
+        if self.image_table is not None:
+            return self.representatives[tts], self.representative_perms[tts]
+        images = self.images(tts)
+        perms = images.argmin(axis=0).astype(np.uint8)
+        return images[perms, np.arange(len(tts))], perms
+
+
+class ArraySearch:
+    """State of the array-based search for shortest formulas.
+
+    Instead of one Formula object per candidate, the search keeps flat
+    arrays indexed by truth table: the best size found so far and a
+    back-pointer (operator plus child truth tables) to the formula
+    achieving it. The settled truth tables are kept in settling order so
+    that a newly settled formula can be combined with all of them in a
+    few vectorized NumPy operations per connective.
+
+    Among candidates of equal size, the one generated first wins:
+    formulas are settled by increasing size and truth table, and the
+    candidates of a newly settled formula are generated in the order
+    negation, conjunctions, disjunctions, biimplications, implications
+    with the new formula as antecedent, implications with the new formula
+    as consequent, each combined with the settled formulas in settling
+    order.
+
+    The state has a fixed size: one byte for the best size, nine bytes
+    for the back-pointer and four bytes for the settling order per truth
+    table, plus a bitmap of the settled truth tables. With state_dir, the
+    arrays are memory-mapped files in that directory, so that the
+    2^32 truth tables of five variables (about 60 GB) need not fit into
+    RAM. With reopen, existing files in state_dir are used as they are.
+
+    With a Symmetry, only the representatives of the classes of truth
+    tables equal up to renaming variables are expanded: sizes are always
+    updated for whole classes, and settling a representative settles its
+    class, with back-pointers obtained by renaming.
+
+    The sizes of formulas and the connectives used are given by the
+    CostModel. Truth tables that cannot be expressed keep UNKNOWN_SIZE.
+    """
+
+    def __init__(self, state_dir=None, symmetry=None,
+                 model=COST_MODELS["standard"], reopen=False):
+        self.state_dir = state_dir
+        self.reopen = reopen
+        self.symmetry = symmetry
+        self.model = model
+        num_truth_tables = 1 << TRUTH_TABLE_SIZE
+        self.best_size = self.allocate(
+            "best_size", num_truth_tables, np.uint8, UNKNOWN_SIZE)
+        self.back = self.allocate(
+            "back_pointers", num_truth_tables, BACK_POINTER_DTYPE)
+        self.settled_bitmap = self.allocate(
+            "settled_bitmap", (num_truth_tables + 7) >> 3, np.uint8)
+        self.settled = self.allocate("settled", num_truth_tables, np.uint32)
+        self.num_settled = 0
+        self.num_candidates = 0
+
+    def allocate(self, name, size, dtype, fill=0):
+        if self.state_dir is None:
+            return np.full(size, fill, dtype=dtype)
+        path = os.path.join(self.state_dir, name)
+        if self.reopen:
+            expected = size * np.dtype(dtype).itemsize
+            if not os.path.exists(path) or os.path.getsize(path) != expected:
+                sys.exit(f"error: {path} is missing or has the wrong size")
+            return np.memmap(path, dtype=dtype, mode="r+", shape=(size,))
+        # New memory-mapped files are zero-filled (and sparse).
+        array = np.memmap(path, dtype=dtype, mode="w+", shape=(size,))
+        if fill:
+            array[:] = fill
+        return array
+
+    def flush(self):
+        """Write the memory-mapped arrays back to their files."""
+        for array in [self.best_size, self.back, self.settled_bitmap,
+                      self.settled]:
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def is_settled(self, tt):
+        return (self.settled_bitmap[tt >> 3] >> (tt & 7)) & 1
+
+    def restore_settled(self, num_settled):
+        """Forget all truth tables settled after the first num_settled.
+
+        The settling order is kept, so only the bitmap needs rebuilding.
+        """
+        self.num_settled = num_settled
+        self.settled_bitmap[:] = 0
+        for start in range(0, num_settled, RESUME_CHUNK_SIZE):
+            tts = np.asarray(self.settled[start:min(
+                start + RESUME_CHUNK_SIZE, num_settled)])
+            np.bitwise_or.at(self.settled_bitmap, tts >> 3,
+                             (1 << (tts & 7)).astype(np.uint8))
+
+    def unsettled(self, min_size):
+        """Generate arrays of the sizes and truth tables of the unsettled
+        truth tables (representatives, with symmetry) of at least min_size
+        that have a known size."""
+        num_truth_tables = 1 << TRUTH_TABLE_SIZE
+        for start in range(0, num_truth_tables, RESUME_CHUNK_SIZE):
+            stop = min(start + RESUME_CHUNK_SIZE, num_truth_tables)
+            sizes = np.asarray(self.best_size[start:stop])
+            settled = np.unpackbits(
+                np.asarray(self.settled_bitmap[start >> 3:stop >> 3]),
+                bitorder="little")
+            selected = ((sizes != UNKNOWN_SIZE) & (sizes >= min_size) &
+                        (settled == 0))
+            if self.symmetry is not None:
+                # Only representatives get back-pointers before they are
+                # settled, which leaves few truth tables to check.
+                selected &= self.back["op"][start:stop] != OP_ATOM
+            tts = np.flatnonzero(selected).astype(np.uint32) + np.uint32(start)
+            if self.symmetry is not None and len(tts):
+                tts = tts[self.symmetry.canonical(tts)[0] == tts]
+            yield self.best_size[tts].astype(np.uint16), tts
+
+    def init_atoms(self):
+        """Return arrays of the sizes and truth tables of the atoms."""
+        sizes = []
+        tts = []
+        for index, atom in enumerate(generate_atoms()):
+            tt = atom.truth_table
+            if self.symmetry is not None and tt != self.symmetry.canonical(
+                    np.array([tt], dtype=np.uint32))[0][0]:
+                continue
+            if self.model.atom < self.best_size[tt]:
+                self.back[tt] = (OP_ATOM, index, 0)
+                sizes.append(self.model.atom)
+                tts.append(tt)
+        sizes = np.array(sizes, dtype=np.uint16)
+        tts = np.array(tts, dtype=np.uint32)
+        self.update(self.best_size, tts, sizes)
+        return sizes, tts
+
+    def update(self, best_size, tts, sizes):
+        """Set the best sizes of tts and, with symmetry, of their classes."""
+        if self.symmetry is None:
+            best_size[tts] = sizes
+        else:
+            images = self.symmetry.images(tts)
+            best_size[images.ravel()] = np.tile(sizes, len(images))
+
+    def settle(self, tt):
+        """Settle tt and, with symmetry, the rest of its class.
+
+        Return the sorted list of settled truth tables.
+        """
+        tts = [tt] if self.symmetry is None else self.settle_class(tt)
+        for tt in tts:
+            self.settled_bitmap[tt >> 3] |= 1 << (tt & 7)
+            self.settled[self.num_settled] = tt
+            self.num_settled += 1
+        return tts
+
+    def settle_class(self, tt):
+        """Set the back-pointers of the class of the representative tt."""
+        op, left, right = self.back[tt].tolist()
+        images = self.symmetry.images(
+            np.array([tt, left, right], dtype=np.uint32))
+        # The first permutation mapping tt to a member of its class
+        # defines the back-pointer of the member.
+        members, perms = np.unique(images[:, 0], return_index=True)
+        if op == OP_ATOM:
+            left = np.array(self.symmetry.perms)[perms, left]
+            right = 0
+        else:
+            left = images[perms, 1]
+            right = images[perms, 2]
+        self.set_back_pointers(members, op, left, right)
+        return members.tolist()
+
+    def generate_candidates(self, tt, size, others, other_sizes):
+        """Generate the candidate batches of combining tt with others.
+
+        Each batch is a tuple (op, truth tables, sizes, left children,
+        right children), where the children may be scalars.
+        """
+        tt = np.uint32(tt)
+        mask = np.uint32(TRUTH_TABLE_MASK)
+        model = self.model
+        if model.negation is not None:
+            yield (OP_NEGATION, np.array([~tt & mask], dtype=np.uint32),
+                   np.array([size + model.negation], dtype=np.uint16), tt, 0)
+        other_sizes = other_sizes.astype(np.uint16) + size
+        def sizes(op):
+            return other_sizes + model.binary[op]
+        if OP_CONJUNCTION in model.binary:
+            yield (OP_CONJUNCTION, tt & others, sizes(OP_CONJUNCTION),
+                   tt, others)
+        if OP_DISJUNCTION in model.binary:
+            yield (OP_DISJUNCTION, tt | others, sizes(OP_DISJUNCTION),
+                   tt, others)
+        if OP_BIIMPLICATION in model.binary:
+            yield (OP_BIIMPLICATION, ~(tt ^ others) & mask,
+                   sizes(OP_BIIMPLICATION), tt, others)
+        if OP_IMPLICATION in model.binary:
+            implication_sizes = sizes(OP_IMPLICATION)
+            yield (OP_IMPLICATION, (~tt | others) & mask, implication_sizes,
+                   tt, others)
+            yield (OP_IMPLICATION, (~others | tt) & mask, implication_sizes,
+                   others, tt)
+        if OP_NAND in model.binary:
+            yield OP_NAND, ~(tt & others) & mask, sizes(OP_NAND), tt, others
+
+    def improvements(self, tts, sizes, best_size):
+        """Return the indices of the first best candidate per improved tt."""
+        if isinstance(best_size, SparseSizes):
+            candidates = best_size.lower(tts, sizes)
+        else:
+            candidates = np.flatnonzero(sizes < best_size[tts])
+        if len(candidates) > 1:
+            candidates = candidates[
+                first_per_truth_table(tts[candidates], sizes[candidates])]
+        return candidates
+
+    def improving_candidates(self, tt, size, num_others, best_size):
+        """Generate the candidates improving on best_size and update it.
+
+        The settled tt is combined with the first num_others settled
+        formulas. Generate tuples (batch number, op, truth tables, sizes,
+        left children, right children, indices of the other formulas).
+        """
+        others = self.settled[:num_others]
+        other_sizes = self.best_size[others]
+        for batch, (op, tts, sizes, left, right) in enumerate(
+                self.generate_candidates(tt, size, others, other_sizes)):
+            self.num_candidates += len(tts)
+            indices = self.improvements(tts, sizes, best_size)
+            if len(indices):
+                improved = tts[indices]
+                sizes = sizes[indices]
+                left = select(left, indices)
+                right = select(right, indices)
+                if self.symmetry is not None:
+                    improved, perms = self.symmetry.canonical(improved)
+                    first = first_per_truth_table(improved, sizes)
+                    improved, perms, sizes, left, right, indices = (
+                        values[first] for values in
+                        (improved, perms, sizes, left, right, indices))
+                    left = self.symmetry.apply_each(perms, left)
+                    right = self.symmetry.apply_each(perms, right)
+                self.update(best_size, improved, sizes)
+                yield batch, op, improved, sizes, left, right, indices
+
+    def set_back_pointers(self, tts, op, left, right):
+        self.back["op"][tts] = op
+        self.back["left"][tts] = left
+        self.back["right"][tts] = right
+
+    def expand(self, tt, size):
+        """Combine the settled tt with all settled formulas.
+
+        Generate pairs of arrays of the new sizes and improved truth
+        tables.
+        """
+        for _, op, tts, sizes, left, right, _ in self.improving_candidates(
+                tt, size, self.num_settled, self.best_size):
+            self.set_back_pointers(tts, op, left, right)
+            yield sizes, tts
+
+    def expand_layer(self, expansions, size, jobs):
+        """Expand a layer of settled formulas using jobs worker processes.
+
+        The expansions are pairs of the settling index of a formula and
+        the number of settled formulas to combine it with. All formulas
+        of the layer must have the given size, so that none of them can
+        improve another. The best formulas found are the same as when
+        expanding the formulas one by one in settling order. Return arrays
+        of the new sizes and improved truth tables.
+        """
+        global _layer_search
+        _layer_search = self
+        tasks = [(expansion_slice, size) for expansion_slice
+                 in layer_slices(expansions, 4 * jobs)]
+        try:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                results = pool.map(expand_layer_slice, tasks)
+        finally:
+            _layer_search = None
+        self.num_candidates += sum(
+            num_candidates for _, num_candidates in results)
+        tts, sizes, news, batches, others, ops, left, right = (
+            np.concatenate(column)
+            for column in zip(*(columns for columns, _ in results)))
+        best = first_per_truth_table(tts, sizes, news, batches, others)
+        tts = tts[best]
+        sizes = sizes[best]
+        self.update(self.best_size, tts, sizes)
+        self.set_back_pointers(tts, ops[best], left[best], right[best])
+        return sizes, tts
+
+    def get_formula(self, tt, cache):
+        return build_formula(self, tt, cache)
+
+
+def build_formula(table, tt, cache):
+    """Build the Formula object for the best formula of tt.
+
+    The table can be an ArraySearch or a ResultTable.
+    """
+    formula = cache.get(tt)
+    if formula is None:
+        op, left, right = table.back[tt].tolist()
+        if op == OP_ATOM:
+            formula = Atom(VARIABLES[left])
+        elif op == OP_NEGATION:
+            formula = Negation(build_formula(table, left, cache))
+        else:
+            formula = OP_CLASSES[op](build_formula(table, left, cache),
+                                     build_formula(table, right, cache))
+        assert formula.truth_table == tt
+        assert table.model.formula_size(formula) == table.best_size[tt]
+        if len(cache) >= MAX_CACHED_FORMULAS:
+            cache.clear()
+        cache[tt] = formula
+    return formula
+
+
+def write_results(path, search):
+    """Atomically write the sizes and back-pointers of the search to path."""
+    num_truth_tables = len(search.best_size)
+    chunk_size = 1 << 20
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as results_file:
+        results_file.write(RESULTS_HEADER.pack(
+            RESULTS_MAGIC, RESULTS_VERSION, len(VARIABLES),
+            search.model.name.encode()))
+        for start in range(0, num_truth_tables, chunk_size):
+            end = min(start + chunk_size, num_truth_tables)
+            records = np.empty(end - start, dtype=RESULT_DTYPE)
+            records["size"] = search.best_size[start:end]
+            for field in ("op", "left", "right"):
+                records[field] = search.back[field][start:end]
+            results_file.write(records.tobytes())
+    os.replace(tmp_path, path)
+
+
+class ResultTable:
+    """Memory-mapped result table written by write_results.
+
+    Opening a table sets the number of variables to that of the table.
+    Truth tables that cannot be expressed have UNKNOWN_SIZE.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as results_file:
+            header = results_file.read(RESULTS_HEADER.size)
+        if len(header) < RESULTS_HEADER.size:
+            raise ValueError(f"{path} is not a result table")
+        magic, version, num_variables, model_name = RESULTS_HEADER.unpack(
+            header)
+        if magic != RESULTS_MAGIC or version != RESULTS_VERSION:
+            raise ValueError(f"{path} is not a result table of this version")
+        self.model = COST_MODELS[model_name.rstrip(b"\0").decode()]
+        set_num_variables(num_variables)
+        entries = np.memmap(path, dtype=RESULT_DTYPE, mode="r",
+                            offset=RESULTS_HEADER.size)
+        if len(entries) != 1 << TRUTH_TABLE_SIZE:
+            raise ValueError(f"{path} is truncated")
+        self.best_size = entries["size"]
+        self.back = entries[["op", "left", "right"]]
+
+    def get_formula(self, tt, cache):
+        if self.best_size[tt] == UNKNOWN_SIZE:
+            return None
+        return build_formula(self, tt, cache)
+
+
+FORMULA_TOKEN_REGEX = re.compile(
+    r"\\neg|\\land|\\lor|\\rightarrow|\\leftrightarrow|\\uparrow|<->|->|"
+    r"[~!&|()]|\w+")
+
+NEGATION_TOKENS = ("\\neg", "~", "!")
+CONJUNCTION_TOKENS = ("\\land", "&")
+NAND_TOKENS = ("\\uparrow",)
+DISJUNCTION_TOKENS = ("\\lor", "|")
+IMPLICATION_TOKENS = ("\\rightarrow", "->")
+BIIMPLICATION_TOKENS = ("\\leftrightarrow", "<->")
+
+
+def parse_formula(text):
+    """Parse a formula as printed by the search or in ASCII notation.
+
+    Negation binds strongest, followed by conjunction and nand,
+    disjunction, implication (right-associative) and biimplication.
+    """
+    if FORMULA_TOKEN_REGEX.sub("", text).strip():
+        raise ValueError(f"invalid characters in formula: {text}")
+    tokens = FORMULA_TOKEN_REGEX.findall(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def advance():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_binary(parse_operand, operators, connective):
+        result = parse_operand()
+        while peek() in operators:
+            advance()
+            result = connective(result, parse_operand())
+        return result
+
+    def parse_biimplication():
+        return parse_binary(parse_implication, BIIMPLICATION_TOKENS,
+                            Biimplication)
+
+    def parse_implication():
+        result = parse_disjunction()
+        if peek() in IMPLICATION_TOKENS:
+            advance()
+            result = Implication(result, parse_implication())
+        return result
+
+    def parse_disjunction():
+        return parse_binary(parse_conjunction, DISJUNCTION_TOKENS,
+                            Disjunction)
+
+    def parse_conjunction():
+        result = parse_unary()
+        while peek() in CONJUNCTION_TOKENS + NAND_TOKENS:
+            connective = Nand if advance() in NAND_TOKENS else Conjunction
+            result = connective(result, parse_unary())
+        return result
+
+    def parse_unary():
+        token = peek()
+        if token in NEGATION_TOKENS:
+            advance()
+            return Negation(parse_unary())
+        if token == "(":
+            advance()
+            result = parse_biimplication()
+            if peek() != ")":
+                raise ValueError(f"missing closing parenthesis: {text}")
+            advance()
+            return result
+        if token in VARIABLES:
+            return Atom(advance())
+        raise ValueError(f"unexpected {token or 'end'} in formula: {text}")
+
+    result = parse_biimplication()
+    if peek() is not None:
+        raise ValueError(f"unexpected {peek()} in formula: {text}")
+    return result
+
+
+def parse_truth_table(spec):
+    """Parse a truth table given as bitstring, as hex number (with 0x
+    prefix) or as formula."""
+    if spec.lower().startswith("0x"):
+        tt = int(spec, 16)
+    elif len(spec) == TRUTH_TABLE_SIZE and set(spec) <= {"0", "1"}:
+        tt = int(spec, 2)
+    else:
+        return parse_formula(spec).truth_table
+    if tt > TRUTH_TABLE_MASK:
+        raise ValueError(f"truth table too large: {spec}")
+    return tt
+
+
+def query_results(path, specs):
+    table = ResultTable(path)
+    cache = {}
+    for spec in specs:
+        tt = parse_truth_table(spec)
+        formula = table.get_formula(tt, cache)
+        tt_string = f"{tt:>0{TRUTH_TABLE_SIZE}b}"
+        if formula is None:
+            print(f"{tt_string}: not expressible")
+        else:
+            print(f"{tt_string}: size {table.best_size[tt]}: {formula}")
+
+
+def export_results(path, export_format):
+    """Write all entries of the result table to stdout as CSV or JSON."""
+    table = ResultTable(path)
+    cache = {}
+    def entries():
+        for tt in range(1 << TRUTH_TABLE_SIZE):
+            formula = table.get_formula(tt, cache)
+            if formula is None:
+                yield f"{tt:>0{TRUTH_TABLE_SIZE}b}", None, None
+            else:
+                yield (f"{tt:>0{TRUTH_TABLE_SIZE}b}", int(table.best_size[tt]),
+                       str(formula))
+    if export_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["truth_table", "size", "formula"])
+        writer.writerows(entries())
+    else:
+        # Written entry by entry to avoid building the whole list.
+        separator = "[\n"
+        for tt_string, size, formula in entries():
+            sys.stdout.write(separator + json.dumps(
+                {"truth_table": tt_string, "size": size, "formula": formula}))
+            separator = ",\n"
+        sys.stdout.write("\n]\n" if separator != "[\n" else "[]\n")
+
+
+class BucketQueue:
+    """Monotone priority queue of truth tables keyed by formula size.
+
+    There is one bucket per size, holding the arrays of truth tables
+    pushed with that size. The search only pushes sizes larger than the
+    size of the formulas it is settling, so a bucket is complete when it
+    is reached: it is then sorted and deduplicated in one step, and the
+    entries whose best size has since decreased are dropped as stale.
+    """
+
+    def __init__(self, best_size):
+        self.best_size = best_size
+        self.buckets = []
+        self.size = 0
+        self.num_queued = 0
+        self.max_queued = 0
+        self.num_pushed = 0
+        self.num_stale = 0
+        self.num_useful = 0
+
+    def push(self, sizes, tts):
+        for size in np.unique(sizes).tolist():
+            assert size > self.size
+            while len(self.buckets) <= size:
+                self.buckets.append([])
+            self.buckets[size].append(tts[sizes == size])
+        self.num_pushed += len(tts)
+        self.num_queued += len(tts)
+        self.max_queued = max(self.max_queued, self.num_queued)
+
+    def pop_layer(self):
+        """Return the sorted unsettled truth tables of the next size.
+
+        Return None if the queue is empty.
+        """
+        while self.size + 1 < len(self.buckets):
+            self.size += 1
+            bucket = self.buckets[self.size]
+            self.buckets[self.size] = None
+            if not bucket:
+                continue
+            tts = np.unique(np.concatenate(bucket))
+            layer = tts[self.best_size[tts] == self.size]
+            num_entries = sum(len(entries) for entries in bucket)
+            self.num_queued -= num_entries
+            self.num_stale += num_entries - len(layer)
+            self.num_useful += len(layer)
+            if len(layer):
+                return layer
+        return None
+
+    def get_counters(self):
+        """Return the current size and the statistics as an array."""
+        counters = [self.size, self.num_queued, self.max_queued,
+                    self.num_pushed, self.num_stale, self.num_useful]
+        return np.array(counters, dtype=np.int64)
+
+    def get_state(self):
+        """Return the contents of the queue as a dict of arrays."""
+        lengths = [sum(len(entries) for entries in bucket) if bucket else 0
+                   for bucket in self.buckets]
+        entries = [np.concatenate(bucket) for bucket in self.buckets if bucket]
+        return {
+            "queue_counters": self.get_counters(),
+            "queue_lengths": np.array(lengths, dtype=np.int64),
+            "queue_entries": (np.concatenate(entries) if entries
+                              else np.zeros(0, dtype=np.uint32)),
+        }
+
+    def set_state(self, state):
+        """Restore a state returned by get_state.
+
+        Without queue_lengths and queue_entries, only the current size
+        and the statistics are restored and the queue is empty.
+        """
+        (self.size, self.num_queued, self.max_queued, self.num_pushed,
+         self.num_stale, self.num_useful) = state["queue_counters"].tolist()
+        self.buckets = []
+        if "queue_entries" not in state:
+            self.num_queued = 0
+            return
+        entries = state["queue_entries"]
+        offset = 0
+        for length in state["queue_lengths"].tolist():
+            self.buckets.append([entries[offset:offset + length]]
+                                if length else [])
+            offset += length
+
+    def refill(self, batches):
+        """Push the (sizes, truth tables) batches without counting them
+        as pushes."""
+        num_pushed = self.num_pushed
+        for sizes, tts in batches:
+            self.push(sizes, tts)
+        self.num_pushed = num_pushed
+
+    def frontier(self):
+        """Return (size, number of queued entries) pairs of the frontier."""
+        return [(size, sum(len(entries) for entries in bucket))
+                for size, bucket in enumerate(self.buckets)
+                if size > self.size and bucket]
+
+    def log_statistics(self):
+        log(f"queue: {self.num_pushed} pushes, {self.num_useful} useful "
+            f"and {self.num_stale} stale pops, at most {self.max_queued} "
+            f"queued entries")
+
+
+def get_rss():
+    """Return the current resident set size in bytes, or None."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss():
+    """Return the peak resident set size of this process and its children
+    (the largest of them) in bytes."""
+    # ru_maxrss is in kilobytes on Linux.
+    return 1024 * max(resource.getrusage(who).ru_maxrss for who in
+                      (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def get_sum_of_sizes(search):
+    """Return the sum of sizes of all expressible truth tables."""
+    sizes = search.best_size
+    return int(sizes.sum(dtype=np.int64)) - UNKNOWN_SIZE * int(
+        np.count_nonzero(sizes == UNKNOWN_SIZE))
+
+
+class Progress:
+    """Periodic progress reports and a final summary of a search."""
+
+    def __init__(self, search, queue, interval):
+        self.search = search
+        self.queue = queue
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.last_settled = search.num_settled
+        self.last_candidates = search.num_candidates
+
+    def improvement_ratio(self):
+        return self.queue.num_pushed / max(self.search.num_candidates, 1)
+
+    def update(self):
+        """Report the progress if the interval has passed."""
+        if self.interval is None:
+            return
+        now = time.perf_counter()
+        seconds = now - self.last_time
+        if seconds < self.interval:
+            return
+        search = self.search
+        settled_rate = (search.num_settled - self.last_settled) / seconds
+        candidate_rate = (search.num_candidates - self.last_candidates) / seconds
+        frontier = " ".join(f"{size}:{num_entries}"
+                            for size, num_entries in self.queue.frontier())
+        rss = get_rss()
+        rss_text = f"{rss / 2 ** 20:.0f} MiB" if rss is not None else "unknown"
+        log(f"progress: size {self.queue.size}, "
+            f"{search.num_settled}/{1 << TRUTH_TABLE_SIZE} settled "
+            f"({settled_rate:.0f}/s), {search.num_candidates} candidates "
+            f"({candidate_rate:.3g}/s), improvement ratio "
+            f"{self.improvement_ratio():.3g}, frontier {frontier or '-'}, "
+            f"RSS {rss_text}")
+        self.last_time = now
+        self.last_settled = search.num_settled
+        self.last_candidates = search.num_candidates
+
+    def summary(self):
+        """Return a dict of statistics about the finished search."""
+        search = self.search
+        queue = self.queue
+        sizes = np.bincount(search.best_size, minlength=UNKNOWN_SIZE + 1)
+        return {
+            "model": search.model.name,
+            "variables": len(VARIABLES),
+            "symmetry": search.symmetry is not None,
+            "wall_seconds": time.perf_counter() - self.start_time,
+            # Including the time of finished worker processes.
+            "cpu_seconds": sum(os.times()[:4]),
+            "settled": search.num_settled,
+            "candidates": search.num_candidates,
+            "pushes": queue.num_pushed,
+            "useful_pops": queue.num_useful,
+            "stale_pops": queue.num_stale,
+            "max_queued": queue.max_queued,
+            "improvement_ratio": self.improvement_ratio(),
+            "peak_rss_bytes": get_peak_rss(),
+            "sum_of_sizes": get_sum_of_sizes(search),
+            "functions_by_size": {
+                size: count for size, count in enumerate(sizes.tolist())
+                if count and size != UNKNOWN_SIZE},
+        }
+
+
+def select(values, indices):
+    if np.ndim(values):
+        return values[indices]
+    return np.full(len(indices), values, dtype=np.uint32)
+
+
+def first_per_truth_table(tts, sizes, *keys):
+    """Return the indices of the best entry for each truth table.
+
+    The best entry has the smallest size. Ties are broken by the given
+    keys, most significant first, and then by position.
+    """
+    order = np.lexsort(keys[::-1] + (sizes, tts))
+    sorted_tts = tts[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_tts[1:] != sorted_tts[:-1]
+    return order[first]
+
+
+def layer_slices(expansions, num_slices):
+    """Split the expansions into contiguous slices of similar work."""
+    # An expansion takes time linear in the number of other formulas.
+    total_work = sum(num_others for _, num_others in expansions)
+    slices = [[]]
+    work = 0
+    for expansion in expansions:
+        if work >= total_work * len(slices) / num_slices:
+            slices.append([])
+        slices[-1].append(expansion)
+        work += expansion[1]
+    return slices
+
+
+# The search whose layer is being expanded. Worker processes are forked
+# for each layer and inherit it.
+_layer_search = None
+
+
+class SparseSizes:
+    """Best sizes of a worker: the inherited sizes plus its improvements.
+
+    The inherited best_size array is only read, so that workers share it
+    with the parent instead of copying it (a memory-mapped one in
+    particular). The improvements are kept in sorted runs of truth tables
+    and sizes, where a new run is merged with the previous ones while
+    they are at most twice as long, so that there are only logarithmically
+    many runs. Sizes only ever decrease, so the smallest entry wins.
+    """
+
+    def __init__(self, best_size):
+        self.best_size = best_size
+        self.runs = []
+
+    def __getitem__(self, tts):
+        sizes = np.array(self.best_size[tts])
+        for keys, values in self.runs:
+            positions = np.minimum(np.searchsorted(keys, tts), len(keys) - 1)
+            found = keys[positions] == tts
+            sizes[found] = np.minimum(sizes[found], values[positions[found]])
+        return sizes
+
+    def lower(self, tts, sizes):
+        """Return the indices of the sizes lower than the best sizes of tts."""
+        # Only entries below the inherited size can be below an improvement.
+        indices = np.flatnonzero(sizes < self.best_size[tts])
+        if self.runs and len(indices):
+            indices = indices[sizes[indices] < self[tts[indices]]]
+        return indices
+
+    def __setitem__(self, tts, sizes):
+        if not len(tts):
+            return
+        run = (np.asarray(tts, dtype=np.uint32), np.asarray(sizes, dtype=np.uint8))
+        while self.runs and len(self.runs[-1][0]) <= 2 * len(run[0]):
+            keys, values = self.runs.pop()
+            run = (np.concatenate([keys, run[0]]),
+                   np.concatenate([values, run[1]]))
+        first = first_per_truth_table(*run)
+        self.runs.append((run[0][first], run[1][first]))
+
+
+def expand_layer_slice(task):
+    """Expand the settled formulas in one slice of a layer.
+
+    Return arrays of the improved truth tables, their sizes, the keys
+    giving the order in which the sequential search generates the
+    candidates (settling index of the new formula, batch number and
+    index of the other formula) and the back-pointers, with one entry
+    per truth table.
+    """
+    expansions, size = task
+    search = _layer_search
+    best_size = SparseSizes(search.best_size)
+    num_candidates = search.num_candidates
+    columns = [[] for _ in range(8)]
+    for index, num_others in expansions:
+        tt = int(search.settled[index])
+        for batch, op, tts, sizes, left, right, others in (
+                search.improving_candidates(tt, size, num_others, best_size)):
+            num = len(tts)
+            values = (tts, sizes, np.full(num, index, dtype=np.uint32),
+                      np.full(num, batch, dtype=np.uint8),
+                      others.astype(np.uint32),
+                      np.full(num, op, dtype=np.uint8), left, right)
+            for column, value in zip(columns, values):
+                column.append(value)
+    dtypes = [np.uint32, np.uint16, np.uint32, np.uint8, np.uint32, np.uint8,
+              np.uint32, np.uint32]
+    columns = [np.concatenate(column).astype(dtype) if column
+               else np.zeros(0, dtype=dtype)
+               for column, dtype in zip(columns, dtypes)]
+    best = first_per_truth_table(*columns[:5])
+    return ([column[best] for column in columns],
+            search.num_candidates - num_candidates)
+
+
+def checkpoint_config(search):
+    return [CHECKPOINT_VERSION, len(VARIABLES), search.symmetry is not None,
+            search.model.name]
+
+
+def write_checkpoint(path, search, queue, layer):
+    """Atomically write the state of the search to path.
+
+    The layer holds the truth tables of the current size that have not
+    been settled yet.
+
+    If the arrays of the search live in a state directory, they are only
+    flushed, and the checkpoint holds just the counters and the layer:
+    see read_checkpoint for how the search continues from the files.
+    """
+    arrays = {
+        "config": np.array(checkpoint_config(search)),
+        "num_candidates": np.array(search.num_candidates, dtype=np.int64),
+        "num_settled": np.array(search.num_settled, dtype=np.int64),
+        "layer": layer,
+    }
+    if search.state_dir is None:
+        arrays.update(queue.get_state())
+        arrays.update({
+            "best_size": search.best_size,
+            "back_pointers": search.back,
+            "settled_bitmap": search.settled_bitmap,
+            "settled": search.settled[:search.num_settled],
+        })
+    else:
+        search.flush()
+        arrays["queue_counters"] = queue.get_counters()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, **arrays)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path, search, queue):
+    """Restore the state written by write_checkpoint and return the layer.
+
+    A checkpoint without arrays continues from the reopened files of the
+    state directory, which the search has kept changing after the
+    checkpoint. The settling order up to the checkpoint is unchanged, so
+    the later settlings are undone by rebuilding the bitmap. Best sizes
+    and back-pointers may have improved since, which is harmless: the
+    search repeats the same steps, and since a candidate only replaces a
+    strictly larger size, the back-pointers end up the same. The queue is
+    rebuilt from the unsettled truth tables with a known size above the
+    current one, which covers the entries pushed after the checkpoint.
+
+    This relies on the files holding all writes made before the
+    interruption, which holds when the process is killed but not
+    necessarily after a crash of the operating system.
+    """
+    with np.load(path) as checkpoint:
+        config = checkpoint["config"].tolist()
+        if config != [str(value) for value in checkpoint_config(search)]:
+            sys.exit(f"error: {path} was written by another version or with "
+                     "other options (--variables, --symmetry, --model)")
+        search.num_candidates = int(checkpoint["num_candidates"])
+        queue.set_state(checkpoint)
+        if "best_size" in checkpoint:
+            search.best_size[:] = checkpoint["best_size"]
+            search.back[:] = checkpoint["back_pointers"]
+            search.settled_bitmap[:] = checkpoint["settled_bitmap"]
+            settled = checkpoint["settled"]
+            search.settled[:len(settled)] = settled
+            search.num_settled = len(settled)
+        elif not search.reopen:
+            sys.exit(f"error: the state of {path} is kept in a state "
+                     "directory; resume with the same --state-dir")
+        else:
+            search.restore_settled(int(checkpoint["num_settled"]))
+            queue.refill(search.unsettled(queue.size + 1))
+        return checkpoint["layer"]
+
+
+def find_all_shortest_arrays(state_dir=None, jobs=1, log_formulas=True,
+                             log_totals=True, symmetry=False, checkpoint=None,
+                             checkpoint_interval=300, resume=False,
+                             progress_interval=None, summary=None,
+                             model=COST_MODELS["standard"]):
+    """Run the array-based search and return it.
+
+    With more than one job, all formulas of the same size are settled
+    together and expanded by a pool of worker processes, with the same
+    result as the sequential search. With symmetry, only one truth table
+    per class of truth tables equal up to renaming variables is
+    expanded; symmetry may also be the Symmetry to use.
+
+    With a checkpoint path, the state is written to it at most every
+    checkpoint_interval seconds (after expanding a formula, or a layer
+    with more than one job). With resume, the search continues from the
+    state in the checkpoint instead of starting from the atoms, and with
+    a state_dir from the files in it.
+
+    Unless log_totals is false, the queue statistics and the totals are
+    logged at the end. With a progress_interval, progress is logged at
+    most that often (at the same points as checkpoints). Statistics of the search are stored
+    in its summary attribute and, with a summary path, written to it as
+    JSON.
+    """
+    def after_expansion(layer):
+        nonlocal last_checkpoint
+        if (checkpoint is not None and
+                time.monotonic() - last_checkpoint >= checkpoint_interval):
+            write_checkpoint(checkpoint, search, queue, layer)
+            last_checkpoint = time.monotonic()
+        progress.update()
+
+    def settle(tt):
+        for tt in search.settle(tt):
+            if log_formulas:
+                formula = search.get_formula(tt, formulas)
+                tt_string = f"{tt:>0{TRUTH_TABLE_SIZE}b}"
+                size = search.best_size[tt]
+                log(f"best for {tt_string}: size {size}: {formula}")
+    if symmetry is True:
+        symmetry = Symmetry()
+    search = ArraySearch(state_dir, symmetry or None, model,
+                         reopen=resume and state_dir is not None)
+    queue = BucketQueue(search.best_size)
+    if resume:
+        layer = read_checkpoint(checkpoint, search, queue)
+        log(f"resuming with {search.num_settled} settled truth tables")
+    else:
+        queue.push(*search.init_atoms())
+        layer = None
+    last_checkpoint = time.monotonic()
+    progress = Progress(search, queue, progress_interval)
+    formulas = {}
+    while True:
+        if layer is None or not len(layer):
+            layer = queue.pop_layer()
+            if layer is None:
+                break
+        size = queue.size
+        expansions = []
+        for position, tt in enumerate(layer.tolist()):
+            index = search.num_settled
+            settle(tt)
+            if jobs == 1:
+                for sizes, tts in search.expand(tt, size):
+                    queue.push(sizes, tts)
+                after_expansion(layer[position + 1:])
+            else:
+                expansions.append((index, search.num_settled))
+        if expansions:
+            queue.push(*search.expand_layer(expansions, size, jobs))
+            after_expansion(layer[:0])
+        layer = None
+    if log_totals:
+        queue.log_statistics()
+        num_inexpressible = (1 << TRUTH_TABLE_SIZE) - search.num_settled
+        if num_inexpressible:
+            log(f"{num_inexpressible} functions cannot be expressed")
+        log(f"sum of sizes: {get_sum_of_sizes(search)}")
+    search.summary = progress.summary()
+    search.summary["jobs"] = jobs
+    if summary is not None:
+        write_summary(summary, search.summary)
+    return search
+
+
+def write_summary(path, summary):
+    with open(path, "w") as summary_file:
+        json.dump(summary, summary_file, indent=1)
+        summary_file.write("\n")
+
+
+# The Symmetry shared by the searches of a sweep, or None. Worker
+# processes are forked after it is built and inherit it.
+_sweep_symmetry = None
+
+
+def sweep_model(task):
+    model_name, results = task
+    search = find_all_shortest_arrays(
+        log_formulas=False, log_totals=False, symmetry=_sweep_symmetry,
+        model=COST_MODELS[model_name])
+    if results is not None:
+        write_results(f"{results}.{model_name}", search)
+    return search.summary
+
+
+def sweep(model_names, symmetry, jobs, results, summary):
+    """Search with each cost model and print a comparison.
+
+    The searches run in up to jobs processes at the same time. With
+    symmetry, they share one Symmetry with precomputed lookup tables,
+    which do not depend on the cost model. With results, the result
+    table of each model is written to results.MODEL.
+    """
+    global _sweep_symmetry
+    _sweep_symmetry = Symmetry(precompute=True) if symmetry else None
+    tasks = [(model_name, results) for model_name in model_names]
+    try:
+        if jobs == 1:
+            summaries = [sweep_model(task) for task in tasks]
+        else:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                summaries = pool.map(sweep_model, tasks)
+    finally:
+        _sweep_symmetry = None
+    print(f"{'model':18} {'expressible':>11} {'max size':>8} "
+          f"{'sum of sizes':>12} {'seconds':>8}")
+    for model_summary in summaries:
+        sizes = model_summary["functions_by_size"]
+        print(f"{model_summary['model']:18} "
+              f"{sum(sizes.values()):11d} {max(sizes):8d} "
+              f"{model_summary['sum_of_sizes']:12d} "
+              f"{model_summary['wall_seconds']:8.2f}")
+    if summary is not None:
+        write_summary(summary, summaries)
+
+
+def report_scaling(state_dir, job_counts, symmetry):
+    """Time the search for each number of jobs and compare the results."""
+    print(f"{'jobs':>4} {'seconds':>9} {'speedup':>8}  result digest")
+    base_seconds = None
+    digests = set()
+    for jobs in job_counts:
+        start = time.perf_counter()
+        search = find_all_shortest_arrays(state_dir, jobs, log_formulas=False,
+                                          log_totals=False, symmetry=symmetry)
+        seconds = time.perf_counter() - start
+        digest = hashlib.sha256()
+        digest.update(search.best_size.view(np.uint8))
+        digest.update(search.back.view(np.uint8))
+        digests.add(digest.hexdigest())
+        if base_seconds is None:
+            base_seconds = seconds
+        print(f"{jobs:4d} {seconds:9.2f} {base_seconds / seconds:8.2f}  "
+              f"{digest.hexdigest()[:16]}")
+    if len(digests) > 1:
+        sys.exit("error: the results differ between numbers of jobs")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find smallest formula representations for all Boolean "
+        "functions over the variables a, b, c, ...")
+    parser.add_argument(
+        "--engine", choices=["arrays", "objects"], default="arrays",
+        help="search with flat NumPy arrays (default) or with one Python "
+        "object per candidate formula (much slower)")
+    parser.add_argument(
+        "--variables", type=int, choices=range(2, 6), default=len(VARIABLES),
+        help="number of variables (default: %(default)s)")
+    parser.add_argument(
+        "--model", choices=list(COST_MODELS), default="standard",
+        help="costs of atoms and connectives and the connectives that may "
+        "be used (default: %(default)s; other models require the array "
+        "engine)")
+    parser.add_argument(
+        "--sweep", nargs="+", metavar="MODEL",
+        choices=list(COST_MODELS) + ["all"],
+        help="search with each of the given cost models (or all) and compare "
+        "the results; --jobs gives the number of concurrent searches")
+    parser.add_argument(
+        "--state-dir", metavar="DIR",
+        help="keep the state of the array engine in memory-mapped files "
+        "in DIR instead of in RAM")
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="expand each layer of formulas of equal size with this many "
+        "worker processes (array engine only)")
+    parser.add_argument(
+        "--scaling", type=int, nargs="+", metavar="JOBS",
+        help="time the array engine for each given number of jobs and "
+        "check that the results are identical")
+    parser.add_argument(
+        "--symmetry", action="store_true",
+        help="only search one function per class of functions that are "
+        "equal up to renaming variables (array engine only)")
+    parser.add_argument(
+        "--checkpoint", metavar="FILE",
+        help="periodically write the state of the array engine to FILE")
+    parser.add_argument(
+        "--checkpoint-interval", type=float, default=300, metavar="SECONDS",
+        help="minimum time between checkpoints (default: %(default)s)")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="continue the search from the state in the checkpoint FILE "
+        "(and, with --state-dir, in DIR)")
+    parser.add_argument(
+        "--quiet", action="store_true",
+        help="do not print the formulas found (array engine only)")
+    parser.add_argument(
+        "--progress", type=float, metavar="SECONDS",
+        help="report the progress of the array engine every SECONDS")
+    parser.add_argument(
+        "--summary", metavar="FILE",
+        help="write statistics of the array engine's search to FILE as JSON")
+    parser.add_argument(
+        "--results", metavar="FILE",
+        help="write a binary table of the results of the array engine to "
+        "FILE, or read it with --query and --export")
+    parser.add_argument(
+        "--query", nargs="+", metavar="FUNCTION",
+        help="print the smallest formulas for the given functions from the "
+        "result table, each given as bitstring, as hex number with 0x "
+        "prefix or as formula (e.g. \"a & ~(b -> c)\")")
+    parser.add_argument(
+        "--export", choices=["csv", "json"],
+        help="print all entries of the result table in the given format")
+    args = parser.parse_args()
+    if args.query or args.export:
+        if args.results is None:
+            parser.error("--query and --export require --results")
+        try:
+            if args.query:
+                query_results(args.results, args.query)
+            if args.export:
+                export_results(args.results, args.export)
+        except (OSError, ValueError) as e:
+            sys.exit(f"error: {e}")
+        return
+    set_num_variables(args.variables)
+    if args.engine != "arrays" and (
+            args.state_dir is not None or args.jobs != 1 or args.scaling
+            or args.symmetry or args.model != "standard" or args.sweep):
+        parser.error("--state-dir, --jobs, --scaling, --symmetry, --model "
+                     "and --sweep require the array engine")
+    if args.engine != "arrays" and (
+            args.checkpoint is not None or args.results is not None or
+            args.quiet or args.progress is not None or
+            args.summary is not None):
+        parser.error("--checkpoint, --results, --quiet, --progress and "
+                     "--summary require the array engine")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.jobs < 1 or (args.scaling and min(args.scaling) < 1):
+        parser.error("the number of jobs must be positive")
+    if args.sweep:
+        if args.state_dir is not None or args.checkpoint is not None:
+            parser.error("--sweep cannot be used with --state-dir and "
+                         "--checkpoint")
+        model_names = list(COST_MODELS) if "all" in args.sweep else args.sweep
+        sweep(model_names, args.symmetry, args.jobs, args.results,
+              args.summary)
+    elif args.scaling:
+        report_scaling(args.state_dir, args.scaling, args.symmetry)
+    elif args.engine == "arrays":
+        search = find_all_shortest_arrays(
+            args.state_dir, args.jobs, log_formulas=not args.quiet,
+            symmetry=args.symmetry, checkpoint=args.checkpoint,
+            checkpoint_interval=args.checkpoint_interval, resume=args.resume,
+            progress_interval=args.progress, summary=args.summary,
+            model=COST_MODELS[args.model])
+        if args.results is not None:
+            write_results(args.results, search)
+    else:
+        find_all_shortest()
+
+
 if __name__ == "__main__":
-    find_all_shortest()
+    main()